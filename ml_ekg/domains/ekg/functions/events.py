@@ -2,13 +2,21 @@
 
 import sys
 import base64
-import json
 
+from gremlin_python.process.graph_traversal import __
+from gremlin_python.process.traversal import Operator
 from neptune_python_utils.endpoints import Endpoints
 from neptune_python_utils.batch_utils import BatchUtils
+from neptune_python_utils.gremlin_utils import GremlinUtils
+from eventbus.aggregate import deaggregate
+from eventbus import codec
 
 ENDPOINTS = Endpoints()
 on_upsert = 'updateSingleCardinalityProperties'
+# properties of an edge listed in ~accumulate are added to the values already in the graph instead of replacing them,
+# once per ~contributor: the values of a contributor already added are replaced
+ACCUMULATE = '~accumulate'
+CONTRIBUTOR = '~contributor'
 
 
 def process_vertices(vertices, batch_size=100):
@@ -18,7 +26,71 @@ def process_vertices(vertices, batch_size=100):
     batch.close()
 
 
+def split_accumulated(edges):
+    """
+    Take the accumulated properties out of the edges, they are added to the graph after the edges are upserted
+    :param edges: [edge]
+    :return: edges, {(edge id, contributor): (from vertex id, {property: value})}, a contributor's last values in
+        the batch replace its earlier ones
+    """
+    out = []
+    contributions = {}
+    for edge in edges:
+        names = edge.get(ACCUMULATE)
+        if not names:
+            out.append(edge)
+            continue
+        contributor = edge.get(CONTRIBUTOR)
+        edge = {k: v for k, v in edge.items() if k not in (ACCUMULATE, CONTRIBUTOR)}
+        values = {}
+        # properties are keyed name:Type(cardinality)
+        for key in [k for k in edge if k.split(':')[0] in names]:
+            value = float(edge.pop(key))
+            values[key.split(':')[0]] = int(value) if value.is_integer() else value
+        contributions[(edge['~id'], contributor)] = (edge['~from'], values)
+        out.append(edge)
+    return out, contributions
+
+
+def contribution_key(name, contributor):
+    """
+    :return: edge property holding the value a contributor added to the property name
+    """
+    return f"{name}_{contributor}"
+
+
+def accumulate(contributions, batch_size=50):
+    """
+    Add values to edge properties, a missing property counts as 0. Each contributor's value is kept on the edge, a
+    contributor seen again, e.g. in a batch retried by the stream, only adds the difference to its previous value.
+    One traversal updates batch_size edges.
+    :param contributions: {(edge id, contributor): (from vertex id, {property: value})}
+    """
+    updates = [(src, id_, name, value, contributor)
+               for (id_, contributor), (src, values) in contributions.items()
+               for name, value in values.items()]
+    gremlin = GremlinUtils(ENDPOINTS)
+    connection = gremlin.remote_connection()
+    try:
+        g = gremlin.traversal_source(connection=connection)
+        for i in range(0, len(updates), batch_size):
+            t = g.withSack(0).inject(0)
+            for src, id_, name, value, contributor in updates[i:i + batch_size]:
+                edge = __.V(src).outE().hasId(id_) \
+                    .sack(Operator.assign).by(__.coalesce(__.values(name), __.constant(0))) \
+                    .sack(Operator.sum).by(__.constant(value))
+                if contributor is not None:
+                    key = contribution_key(name, contributor)
+                    edge = edge.sack(Operator.minus).by(__.coalesce(__.values(key), __.constant(0))) \
+                        .property(key, value)
+                t = t.sideEffect(edge.property(name, __.sack()))
+            t.iterate()
+    finally:
+        connection.close()
+
+
 def process_edges(vertices, edges, batch_size=100):
+    edges, contributions = split_accumulated(edges)
     batch = BatchUtils(ENDPOINTS)
     # create vertices if not already existing
     batch.upsert_vertices(batch_size=batch_size, rows=vertices,
@@ -27,6 +99,8 @@ def process_edges(vertices, edges, batch_size=100):
     batch.upsert_edges(batch_size=batch_size, rows=edges,
                        on_upsert='updateSingleCardinalityProperties')
     batch.close()
+    if contributions:
+        accumulate(contributions)
 
 
 def parse_json(record):
@@ -34,22 +108,25 @@ def parse_json(record):
     seq = record['kinesis']['sequenceNumber']
     data = record['kinesis']['data']
     data = base64.b64decode(data)
-    data = data.decode("utf-8")
-    doc = json.loads(data)
+    doc = codec.decode(data)
     return id_, seq, doc
 
 
 def parse_record(record):
+    """
+    A record may carry several aggregated graph events
+    :return: id_, seq, [graph objects]
+    """
     id_, seq, doc = parse_json(record)
-    graph_obj = doc['detail']['data']
-    return id_, seq, graph_obj
+    graph_objs = [d['detail']['data'] for d in deaggregate(doc)]
+    return id_, seq, graph_objs
 
 
 def handler_vertices(event, context):
     batch = []
     for record in event['Records']:
-        id_, seq, doc = parse_record(record)
-        batch += [doc]
+        id_, seq, docs = parse_record(record)
+        batch += docs
     process_vertices(vertices=batch)
     return {"batchItemFailures": []}
 
@@ -81,10 +158,13 @@ def handler_edges(event, context):
     batch_edges = []
     try:
         for record in event['Records']:
-            id_, seq, edge = parse_record(record)
-            batch_edges += [edge]
-            batch_nodes += nodes_from_edge(edge)
+            id_, seq, edges = parse_record(record)
+            for edge in edges:
+                batch_edges += [edge]
+                batch_nodes += nodes_from_edge(edge)
         process_edges(vertices=batch_nodes, edges=batch_edges)
-    except:
-        print("Failed:\n", event)
+    except Exception as e:
+        # the stream retries the batch, upserts and accumulated contributions are idempotent
+        print("Failed:", e, "\n", event)
+        raise
     return {"batchItemFailures": []}
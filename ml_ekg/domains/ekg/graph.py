@@ -14,6 +14,7 @@ import aws_cdk.aws_neptune_alpha as neptune
 from ml_ekg.domains.ekg import layer as L
 from ml_ekg.domains.ekg import functions
 import os
+import typing
 
 
 class Graph(Construct):
@@ -97,16 +98,21 @@ class Graph(Construct):
                   stream: kinesis.Stream,
                   batch_size: int = 100,
                   parallelization_factor=2,
+                  layers: typing.Sequence[lambda_.ILayerVersion] = (),
                   ):
         """
             Grant read permission to the stream
             :param batch_size:
             :param self:
             :param stream:
+            :param layers: layers to decode the events on the stream
             :return:
             """
         stream.grant_read(self.events_stream_v.role)
         stream.grant_read(self.events_stream_e.role)
+        for layer in layers:
+            self.events_stream_v.add_layers(layer)
+            self.events_stream_e.add_layers(layer)
 
         # create a filtered event source that reads graph vertex events from the kinesis data stream
         self.events_stream_v.add_event_source(event_sources.KinesisEventSource(
@@ -3,9 +3,9 @@
 import hashlib
 import datetime
 import copy
-import json
 import uuid
 from grapher.event import Event
+from eventbus import serde
 
 
 def string2hash(string):
@@ -24,7 +24,7 @@ def parse_gremlin_properties(properties):
 
         suffix = '(single)'
         if type(type_test) == list:
-            out[f"{k}:String{suffix}"] = json.dumps(v)
+            out[f"{k}:String{suffix}"] = serde.dumps_str(v)
         elif type(type_test) == datetime.datetime:
             out[f"{k}:Date{suffix}"] = date_as_gremlin(v)
         elif type(type_test) == int:
@@ -109,6 +109,25 @@ class LineageEdge(Edge):
         super().__init__(src, dst, rel, **properties)
 
 
+class AccumulatedEdge(Edge):
+    """
+    Edge whose properties are added to the values already in the graph when it is upserted again, e.g. a weight
+    counted over several documents. Each contributor, e.g. the document the values were counted in, is added once:
+    upserting its edge again replaces its previous values instead of adding them twice.
+    """
+    def __init__(self, src, dst, rel, contributor, **properties):
+        super().__init__(src, dst, rel, **properties)
+        self.accumulate = list(properties)
+        self.contributor = contributor
+
+    @property
+    def json(self):
+        doc = super().json
+        doc['~accumulate'] = self.accumulate
+        doc['~contributor'] = self.contributor
+        return doc
+
+
 def graph_2_event(gi):
     is_node = True
     if '~to' in gi:
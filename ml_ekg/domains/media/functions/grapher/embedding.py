@@ -0,0 +1,63 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import base64
+import struct
+
+from eventbus import serde
+
+# version 1 header: version, dtype code, dimension, little-endian
+VERSION = 1
+HEADER = struct.Struct('<BBI')
+DTYPES = {
+    'float16': (1, 'e'),
+    'float32': (2, 'f'),
+}
+CODES = {code: (name, fmt) for name, (code, fmt) in DTYPES.items()}
+
+
+def encode(values, dtype='float16'):
+    """
+    Embedding as base64 of a header and the packed little-endian array, about 2.7 bytes per dimension in float16
+    instead of about 20 as a JSON list
+    :param values: [float]
+    :param dtype: float16 or float32
+    :return: str
+    """
+    code, fmt = DTYPES[dtype]
+    n = len(values)
+    data = HEADER.pack(VERSION, code, n) + struct.pack(f'<{n}{fmt}', *values)
+    return base64.b64encode(data).decode("utf-8")
+
+
+def _header(value):
+    data = base64.b64decode(value)
+    version, code, n = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported embedding version {version}")
+    if code not in CODES:
+        raise ValueError(f"Unknown embedding dtype {code}")
+    return data, CODES[code], n
+
+
+def decode(value):
+    """
+    :param value: str written by encode, or a JSON list as written before the codec
+    :return: [float]
+    """
+    if value.lstrip().startswith('['):
+        return serde.loads(value)
+    data, (_, fmt), n = _header(value)
+    return list(struct.unpack_from(f'<{n}{fmt}', data, HEADER.size))
+
+
+def decode_numpy(value):
+    """
+    :param value: str written by encode, or a JSON list as written before the codec
+    :return: numpy.ndarray of the encoded dtype, float32 for JSON lists
+    """
+    import numpy as np
+
+    if value.lstrip().startswith('['):
+        return np.asarray(serde.loads(value), dtype=np.float32)
+    data, (name, _), n = _header(value)
+    return np.frombuffer(data, dtype=np.dtype(name).newbyteorder('<'), count=n, offset=HEADER.size)
@@ -3,6 +3,26 @@
 from PIL import Image
 from io import BytesIO
 import base64
+import collections
+import math
+import os
+import threading
+
+from grapher.event import get_md5
+from storage.blob import get_store, fetch
+
+# payloads above CLAIM_CHECK_BYTES are written to BLOB_STORE and referenced from the event
+BLOB_STORE = os.environ.get('BLOB_STORE')
+CLAIM_CHECK_BYTES = int(os.environ.get('CLAIM_CHECK_BYTES', 32 * 1024))
+# crops are downscaled to CROP_MAX_EDGE pixels on their longest edge and encoded as CROP_FORMAT
+CROP_MAX_EDGE = int(os.environ.get('CROP_MAX_EDGE', '512'))
+CROP_FORMAT = os.environ.get('CROP_FORMAT', 'jpeg')
+CROP_QUALITY = int(os.environ.get('CROP_QUALITY', '85'))
+# images are downscaled to fit ENDPOINT_INPUT_SIZE (e.g. 512 or 512x384) before inference, unset sends the original
+ENDPOINT_INPUT_SIZE = os.environ.get('ENDPOINT_INPUT_SIZE')
+INPUT_QUALITY = int(os.environ.get('INPUT_QUALITY', '90'))
+# resized images kept in process, a payload is resized at most once per container
+PREPROCESS_CACHE_SIZE = int(os.environ.get('PREPROCESS_CACHE_SIZE', '32'))
 
 
 def crop_to_box(im, box):
@@ -19,9 +39,14 @@ def crop_to_box(im, box):
     return cropped
 
 
-def im2bytes(im, format_='jpeg'):
+def im2bytes(im, format_='jpeg', quality=None):
+    if format_.lower() in ('jpeg', 'jpg') and im.mode not in ('RGB', 'L', 'CMYK'):
+        im = im.convert('RGB')
     fp = BytesIO()
-    im.save(fp, format=format_)
+    if quality is None:
+        im.save(fp, format=format_)
+    else:
+        im.save(fp, format=format_, quality=quality)
     return fp.getvalue()
 
 
@@ -30,6 +55,58 @@ def bytes2im(data):
     return im
 
 
+def decode_scale(size, boxes, max_edge):
+    """
+    Smallest scale at which every box still has max_edge pixels on its longest edge
+    :param size: (width, height) of the full resolution image
+    :param boxes: normalized boxes as (left, bot, right, top)
+    :param max_edge: resolution the crops are downscaled to
+    :return: scale in (0, 1]
+    """
+    width, height = size
+    scale = 0.0
+    for left, bot, right, top in boxes:
+        edge = max(abs(right - left) * width, abs(top - bot) * height, 1)
+        scale = max(scale, min(1.0, max_edge / edge))
+    return scale or 1.0
+
+
+def load_image(data, boxes=None, max_edge=CROP_MAX_EDGE):
+    """
+    Decode an image at the smallest resolution that still serves the crops of the given boxes.
+    JPEGs are decoded at a reduced DCT scale (1/2, 1/4 or 1/8) through PIL draft mode, other formats are reduced
+    by an integer factor after decoding.
+    :param data: bytes
+    :param boxes: normalized boxes that will be cropped, None decodes at full resolution
+    :param max_edge: resolution the crops are downscaled to
+    :return: PIL.Image
+    """
+    im = Image.open(BytesIO(data))
+    if not boxes:
+        return im
+    scale = decode_scale(im.size, boxes, max_edge)
+    if scale >= 1.0:
+        return im
+    if im.format == 'JPEG':
+        # draft picks the smallest scale that is at least the requested size
+        im.draft(im.mode, (math.ceil(im.width * scale), math.ceil(im.height * scale)))
+    else:
+        factor = int(1 / scale)
+        if factor > 1:
+            im = im.reduce(factor)
+    return im
+
+
+def fit(im, max_edge=CROP_MAX_EDGE):
+    """
+    Downscale an image so its longest edge is at most max_edge pixels, keeping the aspect ratio
+    """
+    if max(im.size) > max_edge:
+        im = im.copy()
+        im.thumbnail((max_edge, max_edge), Image.BILINEAR)
+    return im
+
+
 def encode_image(data, size=None):
     data = base64.b64encode(data).decode("utf-8")
     return data
@@ -40,10 +117,96 @@ def decode_image(data):
     return data
 
 
-def resize(data, size=(256, 256)):
+def store_payload(data, md5, threshold=None):
+    """
+    Claim-check a payload: keep small payloads inline, store large ones by content hash
+    :param data: bytes
+    :param md5: content hash of data, used as the key
+    :param threshold: payloads above this size are stored, defaults to CLAIM_CHECK_BYTES
+    :return: fields for the event data, either {"payload": base64} or {"payloadRef": uri, "payloadSize": int}
+    """
+    threshold = CLAIM_CHECK_BYTES if threshold is None else threshold
+    if BLOB_STORE is None or len(data) <= threshold:
+        return {"payload": encode_image(data)}
+    uri = get_store(BLOB_STORE).put(md5, data)
+    return {"payloadRef": uri, "payloadSize": len(data)}
+
+
+def load_payload(event_data):
+    """
+    Payload bytes of an event, fetched from the blob store when the event carries a reference
+    :param event_data: event['detail']['data']
+    :return: bytes
+    """
+    if 'payloadRef' in event_data:
+        return fetch(event_data['payloadRef'], BLOB_STORE)
+    return decode_image(event_data['payload'])
+
+
+def parse_size(size):
+    """
+    :param size: "512", "512x384", (512, 384) or None
+    :return: (width, height) or None
+    """
+    if not size:
+        return None
+    if isinstance(size, str):
+        size = [int(v) for v in size.lower().split('x')]
+    elif isinstance(size, int):
+        size = [size]
+    return (size[0], size[-1])
+
+
+def resize(data, size=(256, 256), format_='jpeg', quality=INPUT_QUALITY):
+    """
+    Downscale an image to fit within size, keeping the aspect ratio and without padding, so normalized boxes
+    predicted on the result apply unchanged to the original image.
+    The image is re-encoded once, images that already fit or would not get smaller are returned as is.
+    :param data: bytes
+    :param size: (width, height) bounding the result
+    :return: bytes
+    """
     im = Image.open(BytesIO(data))
-    im = im.resize((256, 256))
-    fp = BytesIO()
-    im.save(fp, format='jpeg')
-    data = fp.getvalue()
-    return data
+    if im.width <= size[0] and im.height <= size[1]:
+        return data
+    if im.format == 'JPEG':
+        im.draft(im.mode, size)
+    im.thumbnail(size, Image.BILINEAR)
+    out = im2bytes(im, format_, quality)
+    return out if len(out) < len(data) else data
+
+
+_preprocessed = collections.OrderedDict()
+_preprocessed_lock = threading.Lock()
+
+
+def preprocess(data, size=ENDPOINT_INPUT_SIZE, md5=None):
+    """
+    Image bytes to send to an endpoint, resized to its input size once per payload.
+    Resized images are cached in process by content hash and size. They are not shared through the blob store:
+    preprocessing only runs on inference cache misses, and a store round trip costs about as much as resizing.
+    :param data: bytes
+    :param size: endpoint input size, see parse_size, None returns data
+    :param md5: content hash of data if already known
+    :return: bytes
+    """
+    size = parse_size(size)
+    if size is None:
+        return data
+    key = f"{md5 or get_md5(data)}-{size[0]}x{size[1]}"
+
+    with _preprocessed_lock:
+        if key in _preprocessed:
+            _preprocessed.move_to_end(key)
+            return _preprocessed[key]
+
+    out = resize(data, size)
+    if out is data:
+        # already fits, nothing worth keeping
+        return out
+
+    with _preprocessed_lock:
+        _preprocessed[key] = out
+        while len(_preprocessed) > PREPROCESS_CACHE_SIZE:
+            _preprocessed.popitem(last=False)
+    return out
@@ -0,0 +1,133 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import numpy as np
+
+
+class LabelConfig(object):
+    """
+    Post-processing settings for object detections, with overrides per label name, e.g.
+    {"person": {"threshold": 0.8, "top_k": 5}, "kite": {"min_area": 0.01, "nms_iou": 0.3}}
+    """
+
+    def __init__(self, threshold=0.6, top_k=0, min_area=0.0, nms_iou=0.5, merge_iou=0.7, labels=None):
+        """
+        :param threshold: minimum score of a detection
+        :param top_k: maximum number of detections kept per label, 0 keeps all
+        :param min_area: minimum box area as a fraction of the image
+        :param nms_iou: boxes of the same label overlapping a higher scoring box by more than this IoU are
+            suppressed, 1 disables suppression
+        :param merge_iou: boxes of the same label overlapping a kept box by at least this IoU are merged into it
+            weighted by score, 0 disables merging
+        :param labels: {label name: {"threshold", "top_k", "min_area", "nms_iou", "merge_iou"}}
+        """
+        self.threshold = threshold
+        self.top_k = top_k
+        self.min_area = min_area
+        self.nms_iou = nms_iou
+        self.merge_iou = merge_iou
+        self.labels = labels or {}
+
+    def get(self, label, name):
+        return self.labels.get(label, {}).get(name, getattr(self, name))
+
+
+def box_areas(boxes):
+    """
+    :param boxes: (n, 4) normalized boxes as (left, bot, right, top)
+    :return: (n,) areas as a fraction of the image
+    """
+    return np.abs((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))
+
+
+def iou(box, boxes):
+    """
+    :param box: (4,) box as (left, bot, right, top)
+    :param boxes: (n, 4)
+    :return: (n,) intersection over union of box with each of boxes
+    """
+    x1 = np.maximum(np.minimum(box[0], box[2]), np.minimum(boxes[:, 0], boxes[:, 2]))
+    x2 = np.minimum(np.maximum(box[0], box[2]), np.maximum(boxes[:, 0], boxes[:, 2]))
+    y1 = np.maximum(np.minimum(box[1], box[3]), np.minimum(boxes[:, 1], boxes[:, 3]))
+    y2 = np.minimum(np.maximum(box[1], box[3]), np.maximum(boxes[:, 1], boxes[:, 3]))
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box_areas(box[None, :])[0] + box_areas(boxes) - intersection
+    return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0.0)
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+    Greedy non-maximum suppression
+    :param boxes: (n, 4) boxes of a single label
+    :param scores: (n,)
+    :param iou_threshold: boxes overlapping a kept box by more than this are suppressed
+    :return: positions of the kept boxes, by descending score
+    """
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        order = order[1:][iou(boxes[i], boxes[order[1:]]) <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def merge(boxes, scores, keep, iou_threshold):
+    """
+    Replace each kept box by the score weighted mean of the boxes overlapping it by at least iou_threshold
+    :param boxes: (n, 4) boxes of a single label
+    :param scores: (n,)
+    :param keep: positions of the kept boxes
+    :param iou_threshold: minimum IoU of a box merged into a kept box
+    :return: (len(keep), 4) merged boxes
+    """
+    merged = boxes[keep].copy()
+    for j, i in enumerate(keep):
+        members = iou(boxes[i], boxes) >= iou_threshold
+        members[i] = True
+        weights = scores[members]
+        merged[j] = (boxes[members] * weights[:, None]).sum(axis=0) / weights.sum()
+    return merged
+
+
+def filter_detections(doc, config):
+    """
+    Select the detections worth cropping before touching any pixels: score and area filters, non-maximum
+    suppression and merging of overlapping boxes per label, then top-k per label
+    :param doc: endpoint response with normalized_boxes, scores, classes and labels
+    :param config: LabelConfig
+    :return: (indices, boxes) of the kept detections by descending score, boxes as (n, 4) after merging
+    """
+    scores = np.asarray(doc['scores'], dtype=np.float64)
+    if scores.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float64)
+    boxes = np.asarray(doc['normalized_boxes'], dtype=np.float64).reshape(-1, 4)
+    classes = np.asarray(doc['classes']).astype(np.int64)
+    names = np.asarray(doc['labels'], dtype=object)[classes]
+
+    # per detection settings, defaults overridden for the configured labels
+    thresholds = np.full(scores.shape, config.threshold, dtype=np.float64)
+    min_areas = np.full(scores.shape, config.min_area, dtype=np.float64)
+    for label, overrides in config.labels.items():
+        mask = names == label
+        thresholds[mask] = overrides.get('threshold', config.threshold)
+        min_areas[mask] = overrides.get('min_area', config.min_area)
+
+    candidates = np.flatnonzero((scores > thresholds) & (box_areas(boxes) >= min_areas))
+    out = boxes.copy()
+
+    # suppress and merge overlapping boxes per label, then keep the top-k of each label
+    keep = []
+    for label in dict.fromkeys(names[candidates]):
+        idx = candidates[names[candidates] == label]
+        kept = nms(boxes[idx], scores[idx], config.get(label, 'nms_iou'))
+        merge_iou = config.get(label, 'merge_iou')
+        if merge_iou > 0:
+            out[idx[kept]] = merge(boxes[idx], scores[idx], kept, merge_iou)
+        top_k = config.get(label, 'top_k')
+        keep.append(idx[kept][:top_k] if top_k else idx[kept])
+    if not keep:
+        return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float64)
+
+    keep = np.concatenate(keep)
+    keep = keep[np.argsort(-scores[keep], kind='stable')]
+    return keep, out[keep]
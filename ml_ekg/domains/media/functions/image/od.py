@@ -1,53 +1,92 @@
 #  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 
-import boto3
-import json
 import os
 from grapher.event import Event, get_md5
 from grapher.common import Node, ValuedNode, LineageEdge, graph_2_event
-from image.common import decode_image, encode_image, im2bytes, bytes2im, crop_to_box
+from eventbus import serde
+from image.common import (
+    load_payload,
+    store_payload,
+    im2bytes,
+    load_image,
+    preprocess,
+    fit,
+    crop_to_box,
+    CROP_FORMAT,
+    CROP_QUALITY,
+    ENDPOINT_INPUT_SIZE,
+    BLOB_STORE,
+)
+from image.detections import LabelConfig, filter_detections
+from image.phash import PHashIndex, find_duplicate
+from storage.blob import get_store
+from inference.cache import from_env
+from inference.client import get_client
 
 import typing
 
-sr = boto3.client("sagemaker-runtime")
+sr = get_client()
 
 ENDPOINT_NAME = os.environ.get('ENDPOINT_NAME', 'image-objects')
 MODEL_PACKAGE_VERSION = os.environ.get('MODEL_PACKAGE_VERSION')
-
-
-def yield_detections(im, doc, threshold=0.6):
-    for box, score, label in list(zip(doc['normalized_boxes'], doc['scores'], doc['classes'])):
-        label_name = doc['labels'][int(label)]
-        im_crop = crop_to_box(im, box)
-        data = im2bytes(im_crop)
-        if score > threshold:
-            yield Event(
-                source=f"ml.cv.od.{label_name}",
-                type_="objectDetected",
-                detail_metadata={
-                    "~id": get_md5(data),
-                    "~type": label_name,
-                },
-                data={
-                    "confidence:Double": score,
-                    "bbox": box,
-                    "payload": encode_image(data)
-                }
-            ).json
-
-
-def infer_objects(procAgent, data):
-    response = sr.invoke_endpoint(
+# OD_LABELS overrides the defaults per label, e.g. {"person": {"threshold": 0.8, "top_k": 5, "nms_iou": 0.3}}
+LABEL_CONFIG = LabelConfig(
+    threshold=float(os.environ.get('OD_THRESHOLD', '0.6')),
+    top_k=int(os.environ.get('OD_TOP_K', '0')),
+    min_area=float(os.environ.get('OD_MIN_AREA', '0.0')),
+    nms_iou=float(os.environ.get('OD_NMS_IOU', '0.5')),
+    merge_iou=float(os.environ.get('OD_MERGE_IOU', '0.7')),
+    labels=serde.loads(os.environ.get('OD_LABELS', '{}')),
+)
+cache = from_env(ENDPOINT_NAME, MODEL_PACKAGE_VERSION, variant=ENDPOINT_INPUT_SIZE)
+phash_index = PHashIndex(get_store(BLOB_STORE) if BLOB_STORE else None, key=f"phash/{ENDPOINT_NAME}")
+
+
+def yield_detections(data, doc, config=LABEL_CONFIG):
+    # only the detections kept by the filter are decoded, cropped and encoded
+    keep, boxes = filter_detections(doc, config)
+    if len(keep) == 0:
+        return
+    boxes = boxes.tolist()
+    im = load_image(data, boxes=boxes)
+
+    for i, box in zip(keep, boxes):
+        score = doc['scores'][i]
+        label_name = doc['labels'][int(doc['classes'][i])]
+        im_crop = fit(crop_to_box(im, box))
+        data = im2bytes(im_crop, CROP_FORMAT, CROP_QUALITY)
+        md5 = get_md5(data)
+        yield Event(
+            source=f"ml.cv.od.{label_name}",
+            type_="objectDetected",
+            detail_metadata={
+                "~id": md5,
+                "~type": label_name,
+            },
+            data={
+                "confidence:Double": score,
+                "bbox": box,
+                **store_payload(data, md5)
+            }
+        ).json
+
+
+def query_endpoint(data, md5):
+    # the endpoint sees the downscaled image, its normalized boxes are cropped from the original
+    return sr.invoke_endpoint(
         EndpointName=ENDPOINT_NAME,
-        Body=data,
+        Body=preprocess(data, md5=md5),
         ContentType='application/x-image',
         Accept='application/json;verbose;n_predictions=20'
     )['Body'].read()
-    doc = json.loads(response)
 
-    im = bytes2im(data)
 
-    detections = list(yield_detections(im, doc))
+def infer_objects(procAgent, data):
+    md5 = get_md5(data)
+    response = cache.get_or_call(md5, lambda: query_endpoint(data, md5))
+    doc = serde.loads(response)
+
+    detections = list(yield_detections(data, doc))
 
     return detections
 
@@ -78,30 +117,42 @@ def parse_to_graph(parent, procAgent, predictions):
 def handler(event, context):  # -> typing.List[Event.json]:
     """
 
-    :param event:
+    :param event: Event.json or a micro-batch {"records": [Event.json]}
     :param context:
     :return: [Event.json]
     """
     procAgent = MODEL_PACKAGE_VERSION
-    parent = Node(
-        id_=event['detail']['metadata']['~id'],
-        label=event['source']
-    )
+    records = event['records'] if 'records' in event else [event]
+
+    events = []
+    for record in records:
+        parent = Node(
+            id_=record['detail']['metadata']['~id'],
+            label=record['source']
+        )
+
+        # decode payload
+        data = load_payload(record['detail']['data'])
 
-    # decode payload
-    data = event['detail']['data']['payload']
-    data = decode_image(data)
+        # near-duplicates of a known image are linked to it instead of inferred
+        duplicate = find_duplicate(phash_index, data, parent.id, parent.label)
+        if duplicate is not None:
+            e_i = LineageEdge(src=parent, dst=Node(*duplicate), rel='duplicateOf', procAgent=procAgent)
+            events += [graph_2_event(e_i.json)]
+            continue
 
-    # infer objects
-    predictions = infer_objects(procAgent, data)
+        # infer objects
+        predictions = infer_objects(procAgent, data)
 
-    # create object graph
-    v, e = parse_to_graph(parent, procAgent, predictions)
-    g = v + e
-    # return object detections to the graph
+        # create object graph
+        v, e = parse_to_graph(parent, procAgent, predictions)
+        g = v + e
+        # return object detections to the graph
 
-    # parse to events
-    events = [graph_2_event(gi) for gi in g]
+        # parse to events
+        events += [graph_2_event(gi) for gi in g] + predictions
+    phash_index.save()
+    print(cache.metrics())
 
     # return events
-    return events + predictions
+    return events
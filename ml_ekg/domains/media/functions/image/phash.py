@@ -0,0 +1,270 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from PIL import Image
+from io import BytesIO
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from eventbus import serde
+
+# images within PHASH_MAX_DISTANCE bits of an indexed image are near-duplicates of it, a negative value disables
+PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE', '2'))
+# a match on the difference hash is only trusted if the DCT hashes are within PHASH_CONFIRM_DISTANCE bits
+# and the aspect ratios within PHASH_ASPECT_TOLERANCE of each other
+PHASH_CONFIRM_DISTANCE = int(os.environ.get('PHASH_CONFIRM_DISTANCE', '6'))
+PHASH_ASPECT_TOLERANCE = float(os.environ.get('PHASH_ASPECT_TOLERANCE', '0.05'))
+# hashes with fewer than PHASH_MIN_BITS bits set or unset come from flat images (blank pages, solid backgrounds,
+# gradients) which collide with each other, they are neither matched nor indexed
+PHASH_MIN_BITS = int(os.environ.get('PHASH_MIN_BITS', '16'))
+# oldest images are dropped from the index above PHASH_MAX_ENTRIES so it stays within Lambda memory
+PHASH_MAX_ENTRIES = int(os.environ.get('PHASH_MAX_ENTRIES', '200000'))
+# the index is stored as PHASH_SHARDS blobs by hash prefix, a save only rewrites the shards that changed
+PHASH_SHARDS = int(os.environ.get('PHASH_SHARDS', '16'))
+# changes are saved at most every PHASH_SAVE_SECONDS, the ones of a recycled container are lost, which only costs
+# a missed near-duplicate
+PHASH_SAVE_SECONDS = float(os.environ.get('PHASH_SAVE_SECONDS', '60'))
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# the DCT hash keeps the lowest HASH_SIZE frequencies of a DCT_SIZE square image
+DCT_SIZE = 32
+
+
+def to_int(bits):
+    """
+    :param bits: numpy bool array, most significant bit first
+    """
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+
+def dct_matrix(n):
+    k = np.arange(n)[:, None]
+    return np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+
+
+_dct = dct_matrix(DCT_SIZE)
+
+
+def fingerprint(data, hash_size=HASH_SIZE):
+    """
+    Hashes of an image from a single decode, JPEGs are decoded at a reduced scale:
+    the difference hash is the sign of the horizontal gradients of a tiny grayscale version of the image, the DCT hash
+    the sign of its lowest frequencies against their median. Both are robust to re-encoding and resizing.
+    :param data: image bytes
+    :return: (difference hash, DCT hash, aspect ratio), the hashes as ints of hash_size * hash_size bits
+    """
+    im = Image.open(BytesIO(data))
+    width, height = im.size
+    im.draft('L', (DCT_SIZE * 2, DCT_SIZE * 2))
+    im = im.convert('L')
+    tiny = np.asarray(im.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    small = np.asarray(im.resize((DCT_SIZE, DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_dct @ small @ _dct.T)[:hash_size, :hash_size].flatten()
+    # the DC term is the mean brightness, it would skew the median
+    return to_int(tiny[:, :-1] > tiny[:, 1:]), to_int(low > np.median(low[1:])), width / height
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def informative(hash_, min_bits=PHASH_MIN_BITS, bits=HASH_BITS):
+    ones = bin(hash_).count('1')
+    return min_bits <= ones <= bits - min_bits
+
+
+def split(bits, parts):
+    """
+    :return: [(shift, mask)] of parts contiguous ranges of bits
+    """
+    out = []
+    start = 0
+    for i in range(parts):
+        width = bits // parts + (i < bits % parts)
+        out.append((start, (1 << width) - 1))
+        start += width
+    return out
+
+
+class PHashIndex(object):
+    """
+    Perceptual hashes of the images seen so far, persisted through a store with get, put and exists as one blob
+    per shard of the hash space. Saving rewrites the shards changed since the last save, merging the entries other
+    containers saved in the meantime. Concurrent saves may still drop a few entries, which only costs a missed
+    near-duplicate.
+    Lookups use multi-index hashing: the difference hash is split into more than max_distance parts, each with an
+    exact match table, so any hash within max_distance equals the query on at least one part.
+    Above max_entries the oldest tenth of the entries is evicted at once and the tables rebuilt.
+    """
+
+    def __init__(self, store=None, key='phash/index', max_distance=PHASH_MAX_DISTANCE,
+                 max_entries=PHASH_MAX_ENTRIES, shards=PHASH_SHARDS, save_seconds=PHASH_SAVE_SECONDS,
+                 confirm_distance=PHASH_CONFIRM_DISTANCE, aspect_tolerance=PHASH_ASPECT_TOLERANCE):
+        self.store = store
+        self.key = key
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.shards = shards
+        self.save_seconds = save_seconds
+        self.confirm_distance = confirm_distance
+        self.max_aspect_log = math.log1p(aspect_tolerance)
+        # hash -> (id, label, time added, DCT hash, aspect ratio)
+        self.entries = {}
+        self.by_shard = [set() for _ in range(shards)]
+        self.parts = split(HASH_BITS, max(5, max_distance + 1))
+        # one {part value: [hash]} table per part
+        self.tables = [{} for _ in self.parts]
+        # entries added before cutoff were evicted, they are not merged back from the store
+        self.cutoff = 0
+        self.loaded = False
+        # shards changed since the last save
+        self.dirty = set()
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def shard(self, hash_):
+        return (hash_ >> 56) % self.shards
+
+    def shard_key(self, shard):
+        return f"{self.key}/{shard:02x}.json"
+
+    def read(self, shard):
+        key = self.shard_key(shard)
+        if self.store is None or not self.store.exists(key):
+            return []
+        doc = serde.loads(self.store.get(key))
+        # entries saved without a DCT hash by an earlier version are skipped
+        return [(int(hash_, 16), id_, label, added, int(phash, 16), aspect)
+                for hash_, id_, label, added, phash, aspect in (e for e in doc['entries'] if len(e) == 6)]
+
+    def index(self, hash_):
+        for table, (shift, mask) in zip(self.tables, self.parts):
+            table.setdefault((hash_ >> shift) & mask, []).append(hash_)
+
+    def insert(self, hash_, id_, label, added, phash, aspect):
+        if hash_ in self.entries or added < self.cutoff:
+            return False
+        self.entries[hash_] = (id_, label, added, phash, aspect)
+        self.by_shard[self.shard(hash_)].add(hash_)
+        self.index(hash_)
+        return True
+
+    def evict(self):
+        if len(self.entries) <= self.max_entries:
+            return
+        by_age = sorted(self.entries, key=lambda hash_: self.entries[hash_][2])
+        drop = len(self.entries) - int(self.max_entries * 0.9)
+        self.cutoff = self.entries[by_age[drop]][2]
+        for hash_ in by_age[:drop]:
+            del self.entries[hash_]
+            self.by_shard[self.shard(hash_)].discard(hash_)
+        self.tables = [{} for _ in self.parts]
+        for hash_ in self.entries:
+            self.index(hash_)
+
+    def load(self):
+        with self.lock:
+            if not self.loaded:
+                for shard in range(self.shards):
+                    try:
+                        for entry in self.read(shard):
+                            self.insert(*entry)
+                    except Exception as e:
+                        # the index is an optimisation, start without the shard rather than fail
+                        print("Error loading phash index shard:", shard, e)
+                self.evict()
+                self.loaded = True
+
+    def candidates(self, hash_):
+        """
+        :return: indexed hashes within max_distance of hash_
+        """
+        found = set()
+        for table, (shift, mask) in zip(self.tables, self.parts):
+            found.update(table.get((hash_ >> shift) & mask, ()))
+        return [h for h in found if hamming(hash_, h) <= self.max_distance]
+
+    def confirms(self, entry, phash, aspect):
+        return (hamming(phash, entry[3]) <= self.confirm_distance
+                and abs(math.log(aspect / entry[4])) <= self.max_aspect_log)
+
+    def lookup(self, hash_, id_=None, phash=None, aspect=None):
+        """
+        :param hash_: difference hash of an image
+        :param id_: id of the image, an image is not a near-duplicate of itself
+        :param phash: DCT hash of the image, checked against the candidates when given
+        :param aspect: aspect ratio of the image, checked against the candidates when given
+        :return: (id, label) of the closest indexed image within max_distance, or None
+        """
+        if self.max_distance < 0:
+            return None
+        self.load()
+        with self.lock:
+            for found in sorted(self.candidates(hash_), key=lambda h: hamming(hash_, h)):
+                entry = self.entries[found]
+                if entry[0] == id_:
+                    continue
+                if phash is not None and aspect is not None and not self.confirms(entry, phash, aspect):
+                    continue
+                return entry[0], entry[1]
+        return None
+
+    def add(self, hash_, id_, label, phash, aspect):
+        self.load()
+        with self.lock:
+            if self.insert(hash_, id_, label, time.time(), phash, aspect):
+                self.dirty.add(self.shard(hash_))
+                self.evict()
+
+    def save(self, force=False):
+        """
+        Write the changed shards back to the store, at most every save_seconds unless forced
+        """
+        if self.store is None or not self.dirty:
+            return
+        if not force and time.time() - self.saved < self.save_seconds:
+            return
+        with self.lock:
+            for shard in sorted(self.dirty):
+                try:
+                    for entry in self.read(shard):
+                        self.insert(*entry)
+                    entries = []
+                    for hash_ in self.by_shard[shard]:
+                        id_, label, added, phash, aspect = self.entries[hash_]
+                        entries.append([f"{hash_:016x}", id_, label, added, f"{phash:016x}", aspect])
+                    self.store.put(self.shard_key(shard), serde.dumps({"entries": entries}))
+                    self.dirty.discard(shard)
+                except Exception as e:
+                    print("Error saving phash index shard:", shard, e)
+            self.evict()
+            self.saved = time.time()
+
+
+def find_duplicate(index, data, id_, label):
+    """
+    Look an image up in the index, images that are not near-duplicates are added to it.
+    Flat images are never matched, their hashes carry too little information.
+    :param index: PHashIndex
+    :param data: image bytes
+    :param id_: id of the image vertex
+    :param label: label of the image vertex
+    :return: (id, label) of the vertex the image duplicates, or None
+    """
+    if index.max_distance < 0:
+        return None
+    try:
+        hash_, phash, aspect = fingerprint(data)
+    except Exception as e:
+        print("Error hashing image:", e)
+        return None
+    if not informative(hash_):
+        return None
+    duplicate = index.lookup(hash_, id_, phash, aspect)
+    if duplicate is None:
+        index.add(hash_, id_, label, phash, aspect)
+    return duplicate
@@ -0,0 +1,297 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from io import BytesIO
+import os
+import threading
+import time
+
+import numpy as np
+
+# similarTo edges to the SIMILARITY_TOP_K closest images with a cosine similarity of at least SIMILARITY_MIN_SCORE
+SIMILARITY_TOP_K = int(os.environ.get('SIMILARITY_TOP_K', '5'))
+SIMILARITY_MIN_SCORE = float(os.environ.get('SIMILARITY_MIN_SCORE', '0.8'))
+# exact search below SIMILARITY_IVF_MIN vectors, an inverted file index of SIMILARITY_NLIST lists above
+SIMILARITY_IVF_MIN = int(os.environ.get('SIMILARITY_IVF_MIN', '5000'))
+SIMILARITY_NLIST = int(os.environ.get('SIMILARITY_NLIST', '64'))
+SIMILARITY_NPROBE = int(os.environ.get('SIMILARITY_NPROBE', '8'))
+# oldest vectors are dropped above SIMILARITY_MAX_ENTRIES per index, and when the vectors of all the indexes of a
+# container outgrow SIMILARITY_MAX_BYTES, so they stay within Lambda memory
+SIMILARITY_MAX_ENTRIES = int(os.environ.get('SIMILARITY_MAX_ENTRIES', '20000'))
+SIMILARITY_MAX_BYTES = int(os.environ.get('SIMILARITY_MAX_BYTES', 256 * 1024 * 1024))
+# changed indexes are saved at most every SIMILARITY_SAVE_SECONDS
+SIMILARITY_SAVE_SECONDS = float(os.environ.get('SIMILARITY_SAVE_SECONDS', '300'))
+
+
+def normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1)
+
+
+def kmeans(x, k, iterations=10, seed=0):
+    """
+    Spherical k-means on normalized rows
+    :return: (k, dim) normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)]
+    for _ in range(iterations):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+class SimilarityIndex(object):
+    """
+    Cosine similarity search over normalized embeddings, updated one vector at a time.
+    Search is exact until ivf_min vectors, then an inverted file index scans only the nprobe lists whose
+    centroids are closest to the query. The centroids are trained again each time the index doubles.
+    The oldest vectors are dropped above max_entries, or above max_bytes of vectors.
+    """
+
+    def __init__(self, ivf_min=SIMILARITY_IVF_MIN, nlist=SIMILARITY_NLIST, nprobe=SIMILARITY_NPROBE,
+                 max_entries=SIMILARITY_MAX_ENTRIES, max_bytes=None):
+        self.ivf_min = ivf_min
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.vectors = None
+        self.size = 0
+        self.ids = []
+        self.labels = []
+        self.positions = {}
+        self.centroids = None
+        self.lists = None
+        self.trained_size = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, id_):
+        return id_ in self.positions
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes if self.vectors is not None else 0
+
+    def capacity(self):
+        """
+        :return: number of vectors kept, one more is allocated so an add can go over it before trimming
+        """
+        if self.max_bytes is None or self.vectors is None:
+            return self.max_entries
+        return max(1, min(self.max_entries, self.max_bytes // (4 * self.vectors.shape[1]) - 1))
+
+    def append(self, vectors, ids, labels):
+        vectors = normalize(vectors).reshape(len(ids), -1)
+        if self.vectors is None:
+            self.vectors = np.empty((max(len(ids), 1024), vectors.shape[1]), dtype=np.float32)
+        elif self.vectors.shape[1] != vectors.shape[1]:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index {self.vectors.shape[1]}")
+        if self.size + len(ids) > len(self.vectors):
+            # doubling stops at the capacity
+            rows = max(min(2 * len(self.vectors), self.capacity() + 1), self.size + len(ids))
+            grown = np.empty((rows, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size:self.size + len(ids)] = vectors
+        for i, (id_, label) in enumerate(zip(ids, labels)):
+            self.positions[id_] = self.size + i
+            self.ids.append(id_)
+            self.labels.append(label)
+        if self.lists is not None:
+            assign = np.argmax(vectors @ self.centroids.T, axis=1)
+            for i, c in enumerate(assign):
+                self.lists[c].append(self.size + i)
+        self.size += len(ids)
+
+    def train(self):
+        x = self.vectors[:self.size]
+        nlist = min(self.nlist, self.size)
+        self.centroids = kmeans(x, nlist)
+        assign = np.argmax(x @ self.centroids.T, axis=1)
+        self.lists = [list(np.flatnonzero(assign == c)) for c in range(nlist)]
+        self.trained_size = self.size
+
+    def trim(self):
+        # drop the oldest tenth beyond the capacity at once rather than one vector per add
+        capacity = self.capacity()
+        keep = max(1, int(capacity * 0.9))
+        drop = self.size - keep
+        self.vectors[:keep] = self.vectors[drop:self.size]
+        if len(self.vectors) > capacity + 1:
+            self.vectors = self.vectors[:capacity + 1].copy()
+        self.size = keep
+        self.ids = self.ids[drop:]
+        self.labels = self.labels[drop:]
+        self.positions = {id_: i for i, id_ in enumerate(self.ids)}
+        if self.lists is not None:
+            self.train()
+
+    def limit(self, max_bytes):
+        """
+        Lower the memory of the vectors to max_bytes, dropping the oldest ones if needed
+        """
+        with self.lock:
+            self.max_bytes = max_bytes
+            if self.vectors is None:
+                return
+            if self.size > self.capacity():
+                self.trim()
+            elif len(self.vectors) > self.capacity() + 1:
+                self.vectors = self.vectors[:self.capacity() + 1].copy()
+
+    def add(self, id_, label, vector):
+        with self.lock:
+            if id_ in self.positions:
+                return
+            self.append([vector], [id_], [label])
+            if self.size > self.capacity():
+                self.trim()
+            elif self.size >= self.ivf_min and self.size >= 2 * self.trained_size:
+                self.train()
+
+    def candidates(self, q):
+        if self.lists is None:
+            return None
+        probe = np.argsort(-(self.centroids @ q))[:self.nprobe]
+        rows = [row for c in probe for row in self.lists[c]]
+        return np.asarray(rows, dtype=np.int64)
+
+    def search(self, vector, k=SIMILARITY_TOP_K, min_score=SIMILARITY_MIN_SCORE, exclude=None):
+        """
+        :param vector: query embedding
+        :param k: maximum number of results
+        :param min_score: minimum cosine similarity
+        :param exclude: id left out of the results, e.g. the query itself
+        :return: [(score, id, label)] by descending score
+        """
+        with self.lock:
+            if self.size == 0:
+                return []
+            q = normalize(vector)
+            rows = self.candidates(q)
+            if rows is None:
+                scores = self.vectors[:self.size] @ q
+                rows = np.arange(self.size)
+            else:
+                scores = self.vectors[rows] @ q
+            mask = scores >= min_score
+            rows, scores = rows[mask], scores[mask]
+            order = np.argsort(-scores, kind='stable')[:k + 1]
+            out = [(float(scores[i]), self.ids[rows[i]], self.labels[rows[i]]) for i in order]
+        return [x for x in out if x[1] != exclude][:k]
+
+    def dumps(self):
+        with self.lock:
+            fp = BytesIO()
+            # float16 halves the blob, the precision is plenty for cosine similarity
+            vectors = self.vectors[:self.size] if self.size else np.empty((0, 0))
+            np.savez(fp, vectors=vectors.astype(np.float16),
+                     ids=np.asarray(self.ids, dtype=str), labels=np.asarray(self.labels, dtype=str))
+            return fp.getvalue()
+
+    def merge(self, data):
+        """
+        Add the vectors of a dumped index that are not in this one, e.g. saved by another container
+        """
+        doc = np.load(BytesIO(data), allow_pickle=False)
+        ids, labels, vectors = list(doc['ids']), list(doc['labels']), doc['vectors']
+        new = [i for i, id_ in enumerate(ids) if id_ not in self.positions]
+        if not new:
+            return
+        with self.lock:
+            self.append(vectors[new], [str(ids[i]) for i in new], [str(labels[i]) for i in new])
+            if self.size > self.capacity():
+                self.trim()
+            elif self.size >= self.ivf_min and self.size >= 2 * self.trained_size:
+                self.train()
+
+
+class IndexStore(object):
+    """
+    Similarity indexes by name, loaded lazily from a blob store (a local directory or S3) and saved back when
+    they changed. Saving merges what other containers saved in the meantime.
+    The indexes share max_bytes of vectors, the largest one drops its oldest vectors when they outgrow it.
+    """
+
+    def __init__(self, store=None, prefix='similarity', save_seconds=SIMILARITY_SAVE_SECONDS,
+                 max_bytes=SIMILARITY_MAX_BYTES, **kwargs):
+        self.store = store
+        self.prefix = prefix
+        self.save_seconds = save_seconds
+        self.max_bytes = max_bytes
+        self.kwargs = kwargs
+        self.indexes = {}
+        self.dirty = set()
+        # the first changes are saved right away, a container may not live through save_seconds
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def key(self, name):
+        return f"{self.prefix}/{name}.npz"
+
+    def load(self, name):
+        index = SimilarityIndex(**self.kwargs)
+        if self.store is not None:
+            try:
+                if self.store.exists(self.key(name)):
+                    index.merge(self.store.get(self.key(name)))
+            except Exception as e:
+                # the index is an optimisation, start empty rather than fail
+                print("Error loading similarity index:", e)
+        return index
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.indexes:
+                self.indexes[name] = self.load(name)
+                self.fit()
+            return self.indexes[name]
+
+    def fit(self):
+        total = sum(index.nbytes for index in self.indexes.values())
+        while total > self.max_bytes:
+            index = max(self.indexes.values(), key=lambda index: index.nbytes)
+            before = index.nbytes
+            index.limit(before - (total - self.max_bytes))
+            if index.nbytes >= before:
+                break
+            total -= before - index.nbytes
+
+    def add(self, name, id_, label, vector):
+        """
+        :return: [(score, id, label)] the closest vectors already indexed, before adding this one
+        """
+        index = self.get(name)
+        similar = index.search(vector, exclude=id_)
+        if id_ not in index:
+            index.add(id_, label, vector)
+            self.dirty.add(name)
+            with self.lock:
+                self.fit()
+        return similar
+
+    def save(self, force=False):
+        if self.store is None or not self.dirty:
+            return
+        if not force and time.time() - self.saved < self.save_seconds:
+            return
+        self.saved = time.time()
+        for name in list(self.dirty):
+            index = self.indexes[name]
+            try:
+                if self.store.exists(self.key(name)):
+                    index.merge(self.store.get(self.key(name)))
+                self.store.put(self.key(name), index.dumps())
+                self.dirty.discard(name)
+            except Exception as e:
+                print("Error saving similarity index:", e)
+        with self.lock:
+            self.fit()
@@ -1,8 +1,14 @@
 #  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 
-import json
-import boto3
-from image.common import decode_image
+from image.common import load_payload, preprocess, encode_image, ENDPOINT_INPUT_SIZE, BLOB_STORE
+from image.phash import PHashIndex, find_duplicate
+from image.similarity import IndexStore
+from storage.blob import get_store
+from grapher.event import get_md5
+from grapher import embedding
+from inference.cache import from_env
+from inference.client import InferenceClient
+from eventbus import serde
 from grapher.common import (
     Node,
     LineageEdge,
@@ -10,36 +16,64 @@ from grapher.common import (
 )
 import os
 
-sr = boto3.client("sagemaker-runtime")
-
 ENDPOINT_NAME = os.environ.get('ENDPOINT_NAME','image-vector')
 MODEL_PACKAGE_VERSION = os.environ.get('MODEL_PACKAGE_VERSION')
+# embeddings are stored packed as float16 or float32, see grapher.embedding
+EMBEDDING_DTYPE = os.environ.get('EMBEDDING_DTYPE', 'float16')
+cache = from_env(ENDPOINT_NAME, MODEL_PACKAGE_VERSION, variant=ENDPOINT_INPUT_SIZE)
+phash_index = PHashIndex(get_store(BLOB_STORE) if BLOB_STORE else None, key=f"phash/{ENDPOINT_NAME}")
+# similarity indexes are shared through the blob store, or kept on the local disk without one
+SIMILARITY_STORE = os.environ.get('SIMILARITY_STORE', BLOB_STORE or 'file:///tmp/similarity')
+indexes = IndexStore(get_store(SIMILARITY_STORE))
+
+
+def index_name(source):
+    # full images are compared with each other, crops with the crops of the same label
+    return 'content.image' if source.startswith('content.image') else source
+
+
+def pack_images(payloads):
+    # batched requests are JSON lines of base64 images
+    return b"\n".join(serde.dumps({"image": encode_image(payload)}) for payload in payloads)
+
+
+client = InferenceClient(ENDPOINT_NAME, content_type='application/x-image', pack=pack_images)
 
-def query_endpoint(img):
-    client = boto3.client('runtime.sagemaker')
-    response = client.invoke_endpoint(EndpointName=ENDPOINT_NAME, ContentType='application/x-image', Body=img)
-    return response
+
+def infer(payloads):
+    """
+    Embeddings of the payloads, from the cache or from batched endpoint requests
+    :param payloads: [bytes] images
+    :return: [embedding]
+    """
+    md5s = [get_md5(data) for data in payloads]
+    bodies = cache.get_or_call_many(
+        md5s,
+        lambda missing: client.invoke([preprocess(payloads[i], md5=md5s[i]) for i in missing])
+    )
+    return [parse_response(body) for body in bodies]
 
 
-def parse_response(query_response):
-    model_predictions = json.loads(query_response['Body'].read())
+def parse_response(body):
+    model_predictions = serde.loads(body)
     embedding = model_predictions['embedding']
     return embedding
 
 
-def parse_to_graph(parent, procAgent, predictions):
+def parse_to_graph(parent, procAgent, predictions, similar=()):
     """
 
     :param parent:
     :param procAgent:
     :param predictions:
+    :param similar: [(score, id, label)] closest indexed images
     :return:
     """
     v = []
     e = []
 
     v_i = parent
-    parent.update_property("embeddings", predictions)
+    parent.update_property("embeddings", embedding.encode(predictions, EMBEDDING_DTYPE))
 
     e_i = LineageEdge(src=parent,
                       dst=v_i,
@@ -50,34 +84,58 @@ def parse_to_graph(parent, procAgent, predictions):
     v += [v_i.json]
     e += [e_i.json]
 
+    for score, id_, label in similar:
+        e += [LineageEdge(src=parent,
+                          dst=Node(id_, label),
+                          rel='similarTo',
+                          procAgent=procAgent,
+                          score=score,
+                          ).json]
+
     return v, e
 
 
 def handler(event, context):
     """
 
-    :param event:
+    :param event: Event.json or a micro-batch {"records": [Event.json]}, inferred together
     :param context:
     :return:
     """
     procAgent = MODEL_PACKAGE_VERSION
-    parent = Node(
-        id_=event['detail']['metadata']['~id'],
-        label=event['source'],
-        uri=event['detail']['metadata'].get('uri', 'od'),
-        size=event['detail']['metadata'].get('size', -1)
-    )
-
-    # decode payload
-    data = event['detail']['data']['payload']
-    data = decode_image(data)
-    # infer vector
-    predictions = query_endpoint(data)
-    predictions = parse_response(predictions)
-
-    # create graph
-    v, e = parse_to_graph(parent, procAgent, predictions)
-    g = v + e
-    # parse to events
-    events = [graph_2_event(gi) for gi in g]
+    records = event['records'] if 'records' in event else [event]
+
+    # decode payloads
+    payloads = [load_payload(record['detail']['data']) for record in records]
+    # near-duplicates of a known image are linked to it instead of inferred
+    duplicates = [
+        find_duplicate(phash_index, data, record['detail']['metadata']['~id'], record['source'])
+        for record, data in zip(records, payloads)
+    ]
+    # infer vectors
+    todo = [i for i, duplicate in enumerate(duplicates) if duplicate is None]
+    predictions = dict(zip(todo, infer([payloads[i] for i in todo])))
+
+    events = []
+    for i, record in enumerate(records):
+        parent = Node(
+            id_=record['detail']['metadata']['~id'],
+            label=record['source'],
+            uri=record['detail']['metadata'].get('uri', 'od'),
+            size=record['detail']['metadata'].get('size', -1)
+        )
+        if duplicates[i] is not None:
+            e_i = LineageEdge(src=parent, dst=Node(*duplicates[i]), rel='duplicateOf', procAgent=procAgent)
+            events += [graph_2_event(e_i.json)]
+            continue
+        prediction = predictions[i]
+        similar = indexes.add(index_name(record['source']), parent.id, parent.label, prediction)
+        # create graph
+        v, e = parse_to_graph(parent, procAgent, prediction, similar)
+        g = v + e
+        # parse to events
+        events += [graph_2_event(gi) for gi in g]
+    phash_index.save()
+    indexes.save()
+    print(cache.metrics())
     return events
@@ -0,0 +1,255 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+# tiers of the inference cache, the LRU is always on, the others when configured
+INFERENCE_CACHE_BYTES = int(os.environ.get('INFERENCE_CACHE_BYTES', 64 * 1024 * 1024))
+INFERENCE_CACHE_DIR = os.environ.get('INFERENCE_CACHE_DIR')
+INFERENCE_CACHE_TABLE = os.environ.get('INFERENCE_CACHE_TABLE')
+INFERENCE_CACHE_TTL = int(os.environ.get('INFERENCE_CACHE_TTL', 30 * 24 * 3600))
+
+
+class LRUCache(object):
+    """
+    In process cache evicting the least recently used values above max_bytes
+    """
+
+    def __init__(self, max_bytes=INFERENCE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= len(self.items.pop(key))
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskCache(object):
+    """
+    Values as files under a local directory, e.g. /tmp of a warm container or a developer machine
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+
+class LocalKVStore(object):
+    """
+    In memory stand-in for the key-value store
+    """
+
+    def __init__(self, ttl=INFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self.items = {}
+
+    def get(self, key):
+        value, expires = self.items.get(key, (None, 0))
+        return value if expires > time.time() else None
+
+    def put(self, key, value):
+        self.items[key] = (value, time.time() + self.ttl)
+
+
+class DynamoDBKVStore(object):
+    """
+    Values shared across containers in a DynamoDB table with time to live enabled on the 'expires' attribute
+    """
+
+    # DynamoDB items are limited to 400 KB
+    MAX_BYTES = 350 * 1024
+
+    def __init__(self, table_name, ttl=INFERENCE_CACHE_TTL, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("dynamodb")
+        self.client = client
+        self.table_name = table_name
+        self.ttl = ttl
+
+    def get(self, key):
+        item = self.client.get_item(TableName=self.table_name, Key={"pk": {"S": key}}).get('Item')
+        # expired items are deleted lazily by DynamoDB
+        if item is None or float(item['expires']['N']) <= time.time():
+            return None
+        return item['value']['B']
+
+    def put(self, key, value):
+        if len(value) > self.MAX_BYTES:
+            return
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "pk": {"S": key},
+                "value": {"B": value},
+                "expires": {"N": str(int(time.time() + self.ttl))}
+            }
+        )
+
+
+class InferenceCache(object):
+    """
+    Endpoint responses by (payload md5, endpoint, model version), looked up tier by tier, fastest first.
+    A hit in a slower tier is copied to the faster ones.
+    """
+
+    def __init__(self, endpoint, version, tiers, variant=None):
+        """
+        :param endpoint: endpoint name
+        :param version: model package version, a new version never sees the results of the previous one
+        :param tiers: caches with get(key) -> bytes or None and put(key, bytes)
+        :param variant: anything else changing the response for the same payload, e.g. the input size
+        """
+        self.endpoint = endpoint
+        self.version = version
+        self.variant = variant
+        self.tiers = list(tiers)
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+
+    def key(self, md5):
+        return hashlib.sha256(f"{self.endpoint}|{self.version}|{self.variant}|{md5}".encode("utf-8")).hexdigest()
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def get(self, md5):
+        key = self.key(md5)
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                # the cache is an optimisation, never block inference on it
+                print("Error reading inference cache:", e)
+                self.count('errors')
+                continue
+            if value is not None:
+                self.count(f"hits_{type(tier).__name__}")
+                self.fill(key, value, self.tiers[:i])
+                return value
+        return None
+
+    def put(self, md5, value):
+        self.fill(self.key(md5), value, self.tiers)
+
+    def fill(self, key, value, tiers):
+        for tier in tiers:
+            try:
+                tier.put(key, value)
+            except Exception as e:
+                print("Error writing inference cache:", e)
+                self.count('errors')
+
+    def get_or_call(self, md5, call):
+        """
+        :param md5: content hash of the payload
+        :param call: call() -> bytes, the endpoint response body
+        :return: bytes
+        """
+        self.count('lookups')
+        value = self.get(md5)
+        if value is None:
+            self.count('misses')
+            value = call()
+            self.put(md5, value)
+        return value
+
+    def get_or_call_many(self, md5s, call):
+        """
+        :param md5s: [str] content hashes of the payloads
+        :param call: call([index]) -> [bytes], the endpoint response bodies of the payloads missing from the cache
+        :return: [bytes] aligned with md5s
+        """
+        out = []
+        for md5 in md5s:
+            self.count('lookups')
+            out.append(self.get(md5))
+        # payloads repeated in the batch are inferred once
+        missing = collections.OrderedDict()
+        for i, value in enumerate(out):
+            if value is None:
+                missing.setdefault(md5s[i], []).append(i)
+        if missing:
+            first = [indices[0] for indices in missing.values()]
+            for (md5, indices), value in zip(missing.items(), call(first)):
+                self.count('misses')
+                self.put(md5, value)
+                for i in indices:
+                    out[i] = value
+        return out
+
+    def metrics(self, namespace='ml-ekg/inference-cache'):
+        """
+        Counters since the last call as a CloudWatch embedded metric format log line
+        """
+        with self.lock:
+            stats, self.stats = self.stats, collections.Counter()
+        names = ['lookups', 'misses', 'errors'] + [f"hits_{type(tier).__name__}" for tier in self.tiers]
+        doc = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": namespace,
+                    "Dimensions": [["endpoint"]],
+                    "Metrics": [{"Name": name, "Unit": "Count"} for name in names]
+                                + [{"Name": "hit_rate", "Unit": "None"}]
+                }]
+            },
+            "endpoint": self.endpoint,
+            "hit_rate": (stats['lookups'] - stats['misses']) / stats['lookups'] if stats['lookups'] else 0.0
+        }
+        doc.update({name: stats[name] for name in names})
+        return json.dumps(doc)
+
+
+def from_env(endpoint, version, variant=None):
+    """
+    Inference cache with the tiers configured by INFERENCE_CACHE_BYTES, INFERENCE_CACHE_DIR and
+    INFERENCE_CACHE_TABLE
+    """
+    tiers = [LRUCache(INFERENCE_CACHE_BYTES)]
+    if INFERENCE_CACHE_DIR:
+        tiers.append(DiskCache(INFERENCE_CACHE_DIR))
+    if INFERENCE_CACHE_TABLE:
+        tiers.append(DynamoDBKVStore(INFERENCE_CACHE_TABLE))
+    return InferenceCache(endpoint, version, tiers, variant=variant)
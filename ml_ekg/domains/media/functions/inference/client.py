@@ -0,0 +1,205 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import concurrent.futures
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# connection settings of the sagemaker-runtime client shared by a container
+SAGEMAKER_MAX_POOL_CONNECTIONS = int(os.environ.get('SAGEMAKER_MAX_POOL_CONNECTIONS', '10'))
+SAGEMAKER_TCP_KEEPALIVE = os.environ.get('SAGEMAKER_TCP_KEEPALIVE', 'true').lower() == 'true'
+SAGEMAKER_RETRY_MODE = os.environ.get('SAGEMAKER_RETRY_MODE', 'adaptive')
+SAGEMAKER_MAX_ATTEMPTS = int(os.environ.get('SAGEMAKER_MAX_ATTEMPTS', '5'))
+SAGEMAKER_CONNECT_TIMEOUT = float(os.environ.get('SAGEMAKER_CONNECT_TIMEOUT', '5'))
+SAGEMAKER_READ_TIMEOUT = float(os.environ.get('SAGEMAKER_READ_TIMEOUT', '60'))
+
+# payloads packed per request, 1 sends one request per payload
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', '1'))
+# SageMaker real-time requests are limited to 6 MB
+INFERENCE_BATCH_BYTES = int(os.environ.get('INFERENCE_BATCH_BYTES', 5 * 1024 * 1024))
+# requests in flight per invoke, bounded by the connection pool of the client
+INFERENCE_CONCURRENCY = int(os.environ.get('INFERENCE_CONCURRENCY', '4'))
+
+# batching is turned off after INFERENCE_BATCH_FAILURES batched requests in a row failed while their payloads
+# succeeded one by one, an endpoint answering a batched request with a ModelError may just not support them
+INFERENCE_BATCH_FAILURES = int(os.environ.get('INFERENCE_BATCH_FAILURES', '3'))
+
+# errors of a batched request retried one payload at a time, anything else is raised
+BATCH_ERRORS = ('ValidationError', 'ModelError')
+# status codes of a container rejecting the content type of a batched request, a 400 may be one bad payload
+UNSUPPORTED_BATCH_STATUS = (406, 415)
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def client_config():
+    return Config(
+        max_pool_connections=SAGEMAKER_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=SAGEMAKER_TCP_KEEPALIVE,
+        retries={"mode": SAGEMAKER_RETRY_MODE, "total_max_attempts": SAGEMAKER_MAX_ATTEMPTS},
+        connect_timeout=SAGEMAKER_CONNECT_TIMEOUT,
+        read_timeout=SAGEMAKER_READ_TIMEOUT,
+    )
+
+
+def get_client(service_name="sagemaker-runtime"):
+    """
+    Client reused across warm invocations and threads. Clients are thread safe once created, creating them is not,
+    so they are created once under a lock from a session of their own.
+    :param service_name: boto3 service name
+    :return: boto3 client
+    """
+    with _lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.session.Session().client(service_name, config=client_config())
+        return _clients[service_name]
+
+
+def pack_lines(payloads):
+    """
+    JSON lines request, one JSON encoded payload per line
+    :param payloads: [bytes]
+    :return: bytes
+    """
+    return b"\n".join(payloads)
+
+
+def unpack_lines(body):
+    """
+    JSON lines response, one result per line
+    :param body: bytes
+    :return: [bytes]
+    """
+    return [line for line in body.splitlines() if line.strip()]
+
+
+class InferenceClient(object):
+    """
+    Endpoint calls for a list of payloads, packed into batched requests when the endpoint supports them.
+    Results are mapped back to the inputs in order. A failed batched request is retried one payload at a time.
+    An endpoint rejecting the format of batched requests, answering with the wrong number of results, or failing
+    max_failures batched requests in a row whose payloads succeed alone, is called once per payload from then on.
+    """
+
+    def __init__(self, endpoint, content_type, accept=None,
+                 batch_size=INFERENCE_BATCH_SIZE, max_bytes=INFERENCE_BATCH_BYTES, concurrency=INFERENCE_CONCURRENCY,
+                 batch_content_type='application/jsonlines', pack=pack_lines, unpack=unpack_lines,
+                 max_failures=INFERENCE_BATCH_FAILURES, client=None):
+        """
+        :param endpoint: endpoint name
+        :param content_type: content type of a single payload
+        :param accept: accept header, if any
+        :param batch_size: maximum payloads per batched request, 1 disables batching
+        :param max_bytes: maximum size of a batched request
+        :param concurrency: requests sent in parallel
+        :param batch_content_type: content type of a batched request
+        :param pack: pack([bytes]) -> bytes, batched request body
+        :param unpack: unpack(bytes) -> [bytes], results of a batched response
+        :param max_failures: failed batched requests in a row turning batching off
+        :param client: sagemaker-runtime client
+        """
+        self.client = client or get_client()
+        self.endpoint = endpoint
+        self.content_type = content_type
+        self.accept = accept
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.batch_content_type = batch_content_type
+        self.pack = pack
+        self.unpack = unpack
+        self.max_failures = max_failures
+        self.batching = batch_size > 1
+        self.failures = 0
+
+    def call(self, body, content_type):
+        kwargs = {"Accept": self.accept} if self.accept else {}
+        response = self.client.invoke_endpoint(EndpointName=self.endpoint, ContentType=content_type,
+                                               Body=body, **kwargs)
+        return response['Body'].read()
+
+    def invoke_one(self, payload):
+        return self.call(payload, self.content_type)
+
+    def invoke_batch(self, payloads):
+        results = self.unpack(self.call(self.pack(payloads), self.batch_content_type))
+        if len(results) != len(payloads):
+            raise ValueError(f"{self.endpoint} returned {len(results)} results for {len(payloads)} inputs")
+        return results
+
+    def chunks(self, payloads):
+        """
+        :return: [[index]] batches of at most batch_size payloads and max_bytes
+        """
+        out = []
+        chunk, size = [], 0
+        for i, payload in enumerate(payloads):
+            if chunk and (len(chunk) >= self.batch_size or size + len(payload) + 1 > self.max_bytes):
+                out.append(chunk)
+                chunk, size = [], 0
+            chunk.append(i)
+            size += len(payload) + 1
+        if chunk:
+            out.append(chunk)
+        return out
+
+    def invoke(self, payloads):
+        """
+        :param payloads: [bytes]
+        :return: [bytes] response body of each payload
+        """
+        chunks = self.chunks(payloads) if self.batching else [[i] for i in range(len(payloads))]
+        if self.concurrency > 1 and len(chunks) > 1:
+            with concurrent.futures.ThreadPoolExecutor(min(self.concurrency, len(chunks))) as executor:
+                results = list(executor.map(lambda chunk: self.invoke_chunk([payloads[i] for i in chunk]), chunks))
+        else:
+            results = [self.invoke_chunk([payloads[i] for i in chunk]) for chunk in chunks]
+
+        out = [None] * len(payloads)
+        for chunk, chunk_results in zip(chunks, results):
+            for i, result in zip(chunk, chunk_results):
+                out[i] = result
+        return out
+
+    def invoke_chunk(self, batch):
+        if len(batch) == 1 or not self.batching:
+            return [self.invoke_one(payload) for payload in batch]
+        try:
+            results = self.invoke_batch(batch)
+            self.failures = 0
+            return results
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in BATCH_ERRORS:
+                raise
+            if unsupported_batch(e):
+                print(f"Batched requests are not supported by {self.endpoint}, falling back to single calls:", e)
+                self.batching = False
+            else:
+                print("Batched request failed, retrying its payloads one by one:", e)
+        except ValueError as e:
+            print("Falling back to single calls:", e)
+            self.batching = False
+        # a payload failing alone raises here, the batch failure was not the endpoint rejecting batches
+        results = [self.invoke_one(payload) for payload in batch]
+        if self.batching:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                print(f"{self.failures} batched requests to {self.endpoint} failed in a row, falling back to single "
+                      f"calls")
+                self.batching = False
+        return results
+
+
+def unsupported_batch(error):
+    """
+    :param error: ClientError of a batched request
+    :return: True when the endpoint rejected the format of the request rather than one of its payloads
+    """
+    if error.response.get('Error', {}).get('Code') == 'ValidationError':
+        return True
+    return error.response.get('OriginalStatusCode') in UNSUPPORTED_BATCH_STATUS
@@ -0,0 +1,125 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import os
+import posixpath
+import threading
+import urllib.parse
+
+
+class LocalBlobStore(object):
+    """
+    Blobs as files under a local directory, a stand-in for S3 in tests
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def uri(self, key):
+        return f"file://{os.path.join(os.path.abspath(self.root), key)}"
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename so concurrent readers never see a partial blob
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return self.uri(key)
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+
+class S3BlobStore(object):
+    def __init__(self, bucket, prefix='', client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("s3")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def uri(self, key):
+        return f"s3://{self.bucket}/{self.key(key)}"
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(key), Body=data)
+        return self.uri(key)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.key(key))['Body'].read()
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(key))
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+
+def from_uri(uri):
+    """
+    :param uri: s3://bucket/prefix or file:///path
+    :return: blob store rooted at the uri
+    """
+    parsed = urllib.parse.urlparse(uri)
+    if parsed.scheme == 's3':
+        return S3BlobStore(parsed.netloc, parsed.path)
+    if parsed.scheme in ('file', ''):
+        return LocalBlobStore(parsed.path)
+    raise ValueError(f"Unsupported blob store {uri}")
+
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def get_store(uri):
+    """
+    Blob store for a uri, reused across warm invocations
+    """
+    with _lock:
+        if uri not in _stores:
+            _stores[uri] = from_uri(uri)
+        return _stores[uri]
+
+
+def within(uri, root):
+    """
+    :param uri: blob uri, e.g. a payloadRef read from an event
+    :param root: blob store uri
+    :return: True if the uri names a blob under the store root
+    """
+    parsed, allowed = urllib.parse.urlparse(uri), urllib.parse.urlparse(root)
+    if (parsed.scheme or 'file') != (allowed.scheme or 'file') or parsed.netloc != allowed.netloc:
+        return False
+    path = posixpath.normpath(parsed.path)
+    prefix = allowed.path
+    if allowed.scheme in ('file', ''):
+        path, prefix = os.path.abspath(path), os.path.abspath(prefix)
+    prefix = posixpath.normpath('/' + prefix.strip('/'))
+    return path.startswith(prefix.rstrip('/') + '/')
+
+
+def fetch(uri, root):
+    """
+    Read a blob by its full uri, e.g. the reference a claim-check left in an event
+    :param root: blob store the reference must be under, events are not trusted to name any other object
+    """
+    if root is None or not within(uri, root):
+        raise ValueError(f"Blob reference {uri} is outside of the blob store {root}")
+    parsed = urllib.parse.urlparse(uri)
+    directory, key = posixpath.normpath(parsed.path).rsplit('/', 1)
+    return get_store(f"{parsed.scheme}://{parsed.netloc}{directory}").get(key)
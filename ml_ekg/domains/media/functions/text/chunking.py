@@ -0,0 +1,104 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import bisect
+import math
+import os
+import re
+
+# windows of at most NER_WINDOW_SUBWORDS estimated subwords overlapping by NER_WINDOW_OVERLAP, the estimate errs on
+# the high side so windows stay below the model's 512 subwords
+NER_WINDOW_SUBWORDS = int(os.environ.get('NER_WINDOW_SUBWORDS', '384'))
+NER_WINDOW_OVERLAP = int(os.environ.get('NER_WINDOW_OVERLAP', '32'))
+
+# ideographs, kana and hangul are a subword each and are not separated by spaces
+WIDE = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+# units a window may start or end at: one wide character, one punctuation character, or up to 16 characters of a
+# word, so a word longer than that (a URL, a hash, a run of unspaced text) is hard split
+UNIT = re.compile(f'[{WIDE}]|[^\\W{WIDE}]{{1,16}}|[^\\w\\s]')
+CHARS_PER_SUBWORD = 4
+
+
+class Window(object):
+    """
+    A slice of a document sent to the endpoint on its own
+    """
+
+    def __init__(self, text, start, end, own_start, own_end):
+        """
+        :param text: the document
+        :param start: offset of the window in the document
+        :param end: end offset of the window in the document
+        :param own_start: predictions starting in [own_start, own_end) are kept from this window, the others are
+            closer to the middle of a neighbour window
+        :param own_end:
+        """
+        self.start = start
+        self.end = end
+        self.own_start = own_start
+        self.own_end = own_end
+        self.text = text[start:end]
+
+
+def subwords(unit):
+    """
+    :return: estimated number of subwords the model's tokenizer splits a unit into
+    """
+    return math.ceil(len(unit) / CHARS_PER_SUBWORD)
+
+
+def windows(text, max_subwords=NER_WINDOW_SUBWORDS, overlap=NER_WINDOW_OVERLAP):
+    """
+    Split a document into windows of at most max_subwords estimated subwords, consecutive windows sharing about
+    overlap subwords so entities cut by a window edge are whole in a neighbour
+    :param text: str
+    :return: [Window]
+    """
+    units = [(m.start(), m.end()) for m in UNIT.finditer(text)]
+    # total[i] is the estimated number of subwords of the units before i
+    total = [0]
+    for start, end in units:
+        total.append(total[-1] + subwords(text[start:end]))
+    if total[-1] <= max_subwords:
+        return [Window(text, 0, len(text), 0, len(text))]
+
+    # [first, last) units of each window
+    spans = []
+    first = 0
+    while True:
+        last = max(first + 1, bisect.bisect_right(total, total[first] + max_subwords) - 1)
+        spans.append((first, last))
+        if last == len(units):
+            break
+        first = max(first + 1, bisect.bisect_left(total, total[last] - overlap))
+
+    # each window owns the text up to the middle of its overlaps with its neighbours
+    bounds = [0]
+    for (_, last), (first, _) in zip(spans, spans[1:]):
+        middle = bisect.bisect_left(total, (total[first] + total[last]) / 2)
+        bounds.append(units[max(first, min(middle, last - 1))][0])
+    bounds.append(len(text))
+
+    return [Window(text, units[first][0], units[last - 1][1], bounds[n], bounds[n + 1])
+            for n, (first, last) in enumerate(spans)]
+
+
+def merge_predictions(chunks):
+    """
+    Token predictions of the windows of a document at document offsets, a prediction in an overlap is kept
+    only from the window owning that region
+    :param chunks: [(Window, [prediction])] predictions with start and end offsets in the window
+    :return: [prediction] by start offset
+    """
+    out = {}
+    for window, predictions in chunks:
+        for p in predictions:
+            if 'start' not in p or p['start'] is None:
+                # without offsets an overlap cannot be told apart, keep one prediction per entity and word
+                out.setdefault((p.get('entity'), p.get('word')), p)
+                continue
+            start = window.start + p['start']
+            if not window.own_start <= start < window.own_end:
+                continue
+            p = dict(p, start=start, end=window.start + p['end'])
+            out[(start, p['end'])] = p
+    return sorted(out.values(), key=lambda p: (p.get('start') is None, p.get('start') or 0))
@@ -0,0 +1,49 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import collections
+import os
+
+# entities mentioned within COOCCURRENCE_WINDOW characters of each other co-occur, 0 uses the whole document
+COOCCURRENCE_WINDOW = int(os.environ.get('COOCCURRENCE_WINDOW', '500'))
+# at most COOCCURRENCE_MAX_PAIRS pairs per document, the most frequent ones
+COOCCURRENCE_MAX_PAIRS = int(os.environ.get('COOCCURRENCE_MAX_PAIRS', '200'))
+
+
+def pair(a, b):
+    # canonical order so (a, b) and (b, a) accumulate together and map to the same edge
+    return (a, b) if a <= b else (b, a)
+
+
+def cooccurrences(mentions, window=COOCCURRENCE_WINDOW, max_pairs=COOCCURRENCE_MAX_PAIRS):
+    """
+    Count the pairs of distinct entities mentioned within window characters of each other, in a single pass
+    over the mentions sorted by offset with a sliding window
+    :param mentions: [(entity id, start offset)] a None offset puts the mention anywhere in the document
+    :param window: maximum distance between the starts of two mentions, 0 pairs every mention of the document
+    :param max_pairs: maximum number of pairs returned, 0 returns all
+    :return: [((entity id, entity id), count)] by descending count then ids
+    """
+    counts = collections.Counter()
+    placed = sorted((start, id_) for id_, start in mentions if start is not None)
+    unplaced = sorted({id_ for id_, start in mentions if start is None})
+    if window <= 0:
+        placed = [(0, id_) for _, id_ in placed]
+        window = 1
+
+    first = 0
+    for i, (start, id_) in enumerate(placed):
+        while placed[first][0] < start - window:
+            first += 1
+        for _, other in placed[first:i]:
+            if other != id_:
+                counts[pair(id_, other)] += 1
+
+    # without offsets the document is the window
+    ids = sorted({id_ for _, id_ in placed} | set(unplaced))
+    for id_ in unplaced:
+        for other in ids:
+            if other != id_ and pair(id_, other) not in counts:
+                counts[pair(id_, other)] = 1
+
+    out = sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+    return out[:max_pairs] if max_pairs else out
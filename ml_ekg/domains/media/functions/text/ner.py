@@ -1,29 +1,51 @@
 #  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 
-import json
-import boto3
 import base64
 from grapher.event import Event, get_md5
-from grapher.common import Node, ValuedNode, LineageEdge, graph_2_event
+from grapher.common import Node, ValuedNode, LineageEdge, AccumulatedEdge, graph_2_event
+from eventbus import serde
+from inference.cache import from_env
+from inference.client import InferenceClient
+from text.chunking import windows, merge_predictions
+from text.resolution import ResolutionIndex, normalize
+from text.cooccurrence import cooccurrences
+from storage.blob import get_store
 import os
 
 ENDPOINT_NAME = os.environ.get('ENDPOINT_NAME', 'text-ner')
 MODEL_PACKAGE_VERSION = os.environ.get('MODEL_PACKAGE_VERSION')
+cache = from_env(ENDPOINT_NAME, MODEL_PACKAGE_VERSION)
+# batched requests are JSON lines of the JSON encoded texts, windows of long documents are sent in parallel
+client = InferenceClient(ENDPOINT_NAME, content_type='application/x-text')
+# canonical entities shared through RESOLUTION_STORE, the Text construct points it to a bucket. The local disk
+# default keeps one index per container, which resolves the same mention differently across containers
+RESOLUTION_STORE = os.environ.get('RESOLUTION_STORE', 'file:///tmp/resolution')
+resolution = ResolutionIndex(get_store(RESOLUTION_STORE), key=f"resolution/{ENDPOINT_NAME}.json")
+# confidence of an entity span from its token scores: mean, min, max or first
+NER_SPAN_SCORE = os.environ.get('NER_SPAN_SCORE', 'mean')
+AGGREGATES = {
+    'mean': lambda scores: sum(scores) / len(scores),
+    'min': min,
+    'max': max,
+    'first': lambda scores: scores[0],
+}
 
 
-def query_endpoint(encoded_text):
-    client = boto3.client('runtime.sagemaker')
-    response = client.invoke_endpoint(EndpointName=ENDPOINT_NAME, ContentType='application/x-text', Body=encoded_text)
-    return response
-
-
-def parse_response(query_response):
-    model_predictions = json.loads(query_response['Body'].read())
+def parse_response(body):
+    model_predictions = serde.loads(body)
     predictions = model_predictions['predictions']
     return predictions
 
 
-def parse_to_graph(parent, procAgent, predictions):
+def parse_to_graph(parent, procAgent, predictions, canonical=None):
+    """
+    :param parent: document vertex
+    :param procAgent:
+    :param predictions: [Event.json] entities
+    :param canonical: {entity id: canonical id} of the entities resolved to another one
+    :return: v, e
+    """
+    canonical = canonical or {}
     v = []
     e = []
 
@@ -35,90 +57,234 @@ def parse_to_graph(parent, procAgent, predictions):
             confidence=obj_['detail']['data']['confidence:Double']
         )
 
+        # the vertex is shared by every document mentioning the entity, the mentions belong to the edge
         e_i = LineageEdge(
             src=v_i,
             dst=parent,
             rel='isDerivedFrom',
             procAgent=procAgent,
+            mentions=obj_['detail']['data'].get('mentions', 1),
+            offsets=obj_['detail']['data'].get('offsets', []),
         )
         v += [v_i.json]
         e += [e_i.json]
 
+        if v_i.id in canonical:
+            e += [LineageEdge(
+                src=v_i,
+                dst=Node(id_=canonical[v_i.id], label=v_i.label),
+                rel='sameAs',
+                procAgent=procAgent,
+            ).json]
+
     return v, e
 
 
-def yield_detections(data, threshold=0.5):
-    def group_predictions(model_predictions):
-        out = []
-        for p in model_predictions:
-            if p['entity'].startswith("B-"):
-                out += [p]
-            else:
-                last = out[-1]
-                last['end'] = p['end']
-                if p['word'].startswith("##"):
-                    last['word'] += p['word'].replace("##", "")
-                else:
-                    last['word'] += ' ' + p['word']
-        return out
-
-    query_response = query_endpoint(json.dumps(data).encode('utf-8'))
-    model_predictions = parse_response(query_response)
-    # model_predictions = group_predictions(model_predictions)
+def cooccurrence_edges(parent, predictions, canonical=None):
+    """
+    Weighted coOccursWith edges between the entities of a document, between canonical entities when resolved.
+    The edge id only depends on the pair and its weight is accumulated, so the edges of another document add
+    their counts to the weight of the same edge instead of duplicating it, while the same document processed
+    again does not.
+    :param parent: document vertex
+    :param predictions: [Event.json] entities with their offsets in the document
+    :param canonical: {entity id: canonical id}
+    :return: [Edge.json]
+    """
+    canonical = canonical or {}
+    labels = {}
+    mentions = []
+    for p in predictions:
+        id_ = canonical.get(p['detail']['metadata']['~id'], p['detail']['metadata']['~id'])
+        labels[id_] = p['source']
+        offsets = p['detail']['data'].get('offsets') or [[None, None]]
+        mentions += [(id_, start) for start, _ in offsets]
+
+    e = []
+    for (a, b), count in cooccurrences(mentions):
+        e += [AccumulatedEdge(
+            src=Node(id_=a, label=labels[a]),
+            dst=Node(id_=b, label=labels[b]),
+            rel='coOccursWith',
+            contributor=parent.id,
+            weight=count
+        ).json]
+    return e
+
+
+def split_tag(entity):
+    """
+    :param entity: BIO tag, e.g. B-PER, I-PER, PER or O
+    :return: (prefix, type) e.g. ('B', 'PER'), ('', 'PER') or ('O', None)
+    """
+    if entity in ('O', None):
+        return 'O', None
+    if len(entity) > 2 and entity[1] == '-' and entity[0] in 'BIE':
+        return entity[0], entity[2:]
+    return '', entity
+
+
+def group_predictions(model_predictions, text=None, aggregate=NER_SPAN_SCORE):
+    """
+    Assemble BIO tagged WordPiece tokens into entity spans in a single pass. A span starts on a B- tag, on a tag
+    of another type, or after a gap in the offsets. An I- tag without an open span starts one, a ## subword
+    continues the open span whatever its tag.
+    :param model_predictions: [{"entity", "word", "score", "start", "end"}] by position
+    :param text: text the offsets refer to, spans take their word from it when given
+    :param aggregate: span confidence from its token scores, mean, min, max or first
+    :return: [{"entity", "word", "score", "start", "end"}]
+    """
+    out = []
+    scores = []
+
+    def close():
+        if out and scores:
+            span = out[-1]
+            span['score'] = AGGREGATES[aggregate](scores)
+            if text is not None and span.get('start') is not None:
+                span['word'] = text[span['start']:span['end']]
+        scores.clear()
 
     for p in model_predictions:
-        score = p['score']
-        label_name = p['entity'].lower()
+        prefix, type_ = split_tag(p.get('entity'))
+        word = p.get('word', '')
+        subword = word.startswith('##')
+        last = out[-1] if out and scores else None
+        if type_ is None:
+            close()
+            continue
+        adjacent = last is not None and (
+            p.get('start') is None or last.get('end') is None or p['start'] - last['end'] <= 1
+        )
+        if last is not None and adjacent and (subword or (prefix in ('I', 'E', '') and type_ == last['entity'])):
+            last['end'] = p.get('end')
+            last['word'] += word[2:] if subword else ' ' + word
+            scores.append(p['score'])
+            continue
+        close()
+        out.append({"entity": type_, "word": word[2:] if subword else word,
+                    "start": p.get('start'), "end": p.get('end')})
+        scores.append(p['score'])
+    close()
+    return out
+
+
+def aggregate_entities(spans, threshold=0.5):
+    """
+    Collapse the mentions of each entity in a document
+    :param spans: [{"entity", "word", "score", "start", "end"}]
+    :param threshold: minimum span confidence
+    :return: [{"entity", "word", "score", "mentions", "offsets"}] score is the best mention
+    """
+    out = {}
+    for span in spans:
+        if span['score'] <= threshold:
+            continue
+        # mentions equal after normalization are the same entity, named after the first one
+        key = (span['entity'].lower(), normalize(span['word']) or span['word'])
+        entity = out.setdefault(key, {"entity": key[0], "word": span['word'], "score": 0.0, "mentions": 0,
+                                      "offsets": []})
+        entity['score'] = max(entity['score'], span['score'])
+        entity['mentions'] += 1
+        if span.get('start') is not None:
+            entity['offsets'].append([span['start'], span['end']])
+    return list(out.values())
+
+
+def yield_detections(model_predictions, threshold=0.5, text=None):
+    spans = group_predictions(model_predictions, text=text)
+
+    for p in aggregate_entities(spans, threshold):
+        label_name = p['entity']
         word = p['word']
-        if score > threshold:
-            yield Event(
-                source=f"ml.text.ner.{label_name}",
-                type_="entityDetected",
-                detail_metadata={
-                    "~id": get_md5(f"{label_name}:{word}".encode("utf-8")),
-                    "~type": label_name,
-                },
-                data={
-                    "confidence:Double": score,
-                    "payload": word
-                }
-            ).json
-
-
-def infer(procAgent, data):
-    detections = yield_detections(data)
-    return list(detections)
+        yield Event(
+            source=f"ml.text.ner.{label_name}",
+            type_="entityDetected",
+            detail_metadata={
+                "~id": get_md5(f"{label_name}:{normalize(word) or word}".encode("utf-8")),
+                "~type": label_name,
+            },
+            data={
+                "confidence:Double": p['score'],
+                "payload": word,
+                "mentions": p['mentions'],
+                "offsets": p['offsets'],
+            }
+        ).json
+
+
+def infer(procAgent, texts):
+    """
+    Entities of the texts, from the cache or from endpoint requests. Long texts are split into overlapping
+    windows inferred in parallel, their predictions merged back at document offsets.
+    :param procAgent:
+    :param texts: [str]
+    :return: [[Event.json]] aligned with texts
+    """
+    chunks = [windows(text) for text in texts]
+    encoded = [serde.dumps(window.text) for text_windows in chunks for window in text_windows]
+    bodies = iter(cache.get_or_call_many(
+        [get_md5(encoded_text) for encoded_text in encoded],
+        lambda missing: client.invoke([encoded[i] for i in missing])
+    ))
+    out = []
+    for text, text_windows in zip(texts, chunks):
+        predictions = merge_predictions([(window, parse_response(next(bodies))) for window in text_windows])
+        out.append(list(yield_detections(predictions, text=text)))
+    return out
+
+
+def resolve(predictions):
+    """
+    :param predictions: [Event.json] entities
+    :return: {entity id: canonical id} of the entities resolved to another one
+    """
+    out = {}
+    for p in predictions:
+        id_ = p['detail']['metadata']['~id']
+        canonical = resolution.resolve(p['detail']['metadata']['~type'], p['detail']['data']['payload'], id_)
+        if canonical != id_:
+            out[id_] = canonical
+    return out
 
 
 def handler(event, context):  # -> typing.List[Event.json]:
     """
 
-    :param event:
+    :param event: Event.json or a micro-batch {"records": [Event.json]}, inferred together
     :param context:
     :return: [Event.json]
     """
     # print("event:", type(event), event)
     procAgent = MODEL_PACKAGE_VERSION
-    parent = Node(
-        id_=event['detail']['metadata']['~id'],
-        label=event['source']
-    )
+    records = event['records'] if 'records' in event else [event]
 
-    # decode payload
-    data = event['detail']['data']['payload']
+    # decode payloads
+    texts = [record['detail']['data']['payload'] for record in records]
 
     # infer objects
-    predictions = infer(procAgent, data)
+    detections = infer(procAgent, texts)
+
+    events = []
+    for record, predictions in zip(records, detections):
+        parent = Node(
+            id_=record['detail']['metadata']['~id'],
+            label=record['source']
+        )
 
-    # create object graph
-    v, e = parse_to_graph(parent, procAgent, predictions)
-    g = v + e
-    # return object detections to the graph
+        # create object graph, linking entities to their canonical entity and to each other
+        canonical = resolve(predictions)
+        v, e = parse_to_graph(parent, procAgent, predictions, canonical)
+        e += cooccurrence_edges(parent, predictions, canonical)
+        g = v + e
+        # return object detections to the graph
 
-    # parse to events
-    events = [graph_2_event(gi) for gi in g]
+        # parse to events
+        events += [graph_2_event(gi) for gi in g] + predictions
+    resolution.save()
+    print(cache.metrics())
 
     # return events
-    return events + predictions
+    return events
 
 
@@ -0,0 +1,184 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+from eventbus import serde
+
+# mentions sharing at least RESOLUTION_THRESHOLD of their character n-grams resolve to the same entity
+RESOLUTION_THRESHOLD = float(os.environ.get('RESOLUTION_THRESHOLD', '0.6'))
+# oldest entities are dropped above RESOLUTION_MAX_ENTRIES so the index stays within Lambda memory
+RESOLUTION_MAX_ENTRIES = int(os.environ.get('RESOLUTION_MAX_ENTRIES', '100000'))
+# new entities are saved at most every RESOLUTION_SAVE_SECONDS, the first ones right away
+RESOLUTION_SAVE_SECONDS = float(os.environ.get('RESOLUTION_SAVE_SECONDS', '30'))
+
+NGRAM = 3
+# 16 bands of 2 rows find pairs above a Jaccard similarity of about (1/16) ** (1/2) = 0.25 with high probability
+BANDS = 16
+ROWS = 2
+PRIME = (1 << 61) - 1
+
+_rng = np.random.default_rng(20231)
+# a, b below 2 ** 31 so a * x + b of a 32 bit x never overflows 64 bits
+_A = _rng.integers(1, 1 << 31, size=BANDS * ROWS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, size=BANDS * ROWS, dtype=np.uint64)
+
+SUFFIXES = {
+    'inc', 'incorporated', 'corp', 'corporation', 'co', 'company', 'ltd', 'limited', 'llc', 'plc', 'gmbh', 'ag',
+    'sa', 'nv', 'bv', 'lp', 'llp',
+}
+PUNCTUATION = re.compile(r"[^\w\s]")
+SPACES = re.compile(r"\s+")
+
+
+def normalize(word):
+    """
+    Normalization rules: unicode compatibility form, case folding, punctuation, a leading "the" and trailing
+    company suffixes, e.g. "The Amazon.com, Inc." -> "amazon com"
+    """
+    word = unicodedata.normalize('NFKC', word).casefold()
+    word = SPACES.sub(' ', PUNCTUATION.sub(' ', word)).strip()
+    tokens = word.split(' ')
+    if len(tokens) > 1 and tokens[0] == 'the':
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in SUFFIXES:
+        tokens = tokens[:-1]
+    return ' '.join(tokens)
+
+
+def shingles(normalized, n=NGRAM):
+    padded = f" {normalized} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def minhash(grams):
+    """
+    :param grams: set of str
+    :return: (BANDS * ROWS,) uint64 signature
+    """
+    x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    return ((x[:, None] * _A[None, :] + _B[None, :]) % PRIME).min(axis=0)
+
+
+def bands(signature):
+    return [zlib.crc32(signature[i * ROWS:(i + 1) * ROWS].tobytes()) + (i << 32) for i in range(BANDS)]
+
+
+class ResolutionIndex(object):
+    """
+    Canonical entities by label, found by normalized name first, then by MinHash LSH candidates verified on the
+    Jaccard similarity of their character n-grams. Persisted as a single blob through a store with get, put and
+    exists, saving merges what other containers saved in the meantime.
+    """
+
+    def __init__(self, store=None, key='resolution/index.json', threshold=RESOLUTION_THRESHOLD,
+                 max_entries=RESOLUTION_MAX_ENTRIES, save_seconds=RESOLUTION_SAVE_SECONDS):
+        self.store = store
+        self.key = key
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.save_seconds = save_seconds
+        self.saved = 0
+        # (label, normalized) -> canonical id, in insertion order
+        self.entries = {}
+        self.grams = {}
+        self.buckets = {}
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    def insert(self, label, normalized, id_):
+        key = (label, normalized)
+        if key in self.entries:
+            return
+        self.entries[key] = id_
+        self.grams[key] = shingles(normalized)
+        for band in bands(minhash(self.grams[key])):
+            self.buckets.setdefault((label, band), set()).add(key)
+        if len(self.entries) > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        # dicts keep insertion order, drop the oldest tenth at once and rebuild the buckets
+        drop = len(self.entries) - int(self.max_entries * 0.9)
+        for key in list(self.entries)[:drop]:
+            del self.entries[key]
+            del self.grams[key]
+        self.buckets = {}
+        for key, grams in self.grams.items():
+            for band in bands(minhash(grams)):
+                self.buckets.setdefault((key[0], band), set()).add(key)
+
+    def read(self):
+        if self.store is None or not self.store.exists(self.key):
+            return []
+        return serde.loads(self.store.get(self.key))['entries']
+
+    def load(self):
+        with self.lock:
+            if not self.loaded:
+                try:
+                    for label, normalized, id_ in self.read():
+                        self.insert(label, normalized, id_)
+                except Exception as e:
+                    # the index is an optimisation, start empty rather than fail
+                    print("Error loading resolution index:", e)
+                self.loaded = True
+
+    def candidates(self, label, grams):
+        out = set()
+        for band in bands(minhash(grams)):
+            out |= self.buckets.get((label, band), set())
+        return out
+
+    def resolve(self, label, word, id_):
+        """
+        :param label: entity type
+        :param word: mention
+        :param id_: id of the mention vertex
+        :return: canonical id of the entity, id_ for a new entity
+        """
+        self.load()
+        normalized = normalize(word) or word
+        with self.lock:
+            key = (label, normalized)
+            if key in self.entries:
+                return self.entries[key]
+            grams = shingles(normalized)
+            best, best_score = None, self.threshold
+            for candidate in self.candidates(label, grams):
+                score = jaccard(grams, self.grams[candidate])
+                if score >= best_score:
+                    best, best_score = candidate, score
+            canonical = self.entries[best] if best is not None else id_
+            self.insert(label, normalized, canonical)
+            self.dirty = True
+            return canonical
+
+    def save(self, force=False):
+        if self.store is None or not self.dirty:
+            return
+        if not force and time.time() - self.saved < self.save_seconds:
+            return
+        with self.lock:
+            self.saved = time.time()
+            try:
+                for label, normalized, id_ in self.read():
+                    self.insert(label, normalized, id_)
+                entries = [[label, normalized, id_] for (label, normalized), id_ in self.entries.items()]
+                self.store.put(self.key, serde.dumps({"entries": entries}))
+                self.dirty = False
+            except Exception as e:
+                print("Error saving resolution index:", e)
@@ -8,7 +8,10 @@ from aws_cdk import (
     aws_stepfunctions as sfn,
     aws_stepfunctions_tasks as tasks,
     aws_iam as iam,
+    aws_s3 as s3,
+    aws_dynamodb as dynamodb,
     Aws,
+    RemovalPolicy,
 )
 from constructs import Construct
 from ml_ekg.domains.media import functions
@@ -21,17 +24,42 @@ class Image(Construct):
 
     def __init__(self, scope: Construct, construct_id: str,
                  bus: Bus,
+                 micro_batch: int = 0,
+                 od_input_size: str = "512",
+                 vector_input_size: str = "224",
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         F = os.path.dirname(functions.__file__)
 
+        # claim-check store for image payloads too large to travel in events
+        payloads = s3.Bucket(self, 'payloads', encryption=s3.BucketEncryption.S3_MANAGED,
+                             enforce_ssl=True,
+                             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                             removal_policy=RemovalPolicy.DESTROY,
+                             auto_delete_objects=True,
+                             lifecycle_rules=[s3.LifecycleRule(expiration=Duration.days(30))],
+                             )
+        blob_store = f"s3://{payloads.bucket_name}/payloads"
+        self.payloads = payloads
+
+        # endpoint responses shared across containers, keyed by payload, endpoint and model version
+        inference_cache = dynamodb.Table(self, 'inference-cache',
+                                         partition_key=dynamodb.Attribute(name="pk",
+                                                                          type=dynamodb.AttributeType.STRING),
+                                         billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                                         time_to_live_attribute="expires",
+                                         removal_policy=RemovalPolicy.DESTROY,
+                                         )
+
         # Object detection domain
         endpoint = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:endpoint/image-od"
+        model_package_version = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:model-package/image-od/1"
         m_od = lambda_p.PythonFunction(
             self, 'm-od',
             entry=F,
             index='image/od.py',
+            layers=[bus.layer],
             runtime=lambda_.Runtime.PYTHON_3_12,
             memory_size=2048,
             timeout=Duration.seconds(120),
@@ -44,9 +72,15 @@ class Image(Construct):
             ],
             environment={
                 "ENDPOINT_NAME": "image-od",
-                "MODEL_PACKAGE_VERSION": f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:model-package/image-od/1"
+                "MODEL_PACKAGE_VERSION": model_package_version,
+                "BLOB_STORE": blob_store,
+                # images are downscaled to the input size of the od model before inference
+                "ENDPOINT_INPUT_SIZE": od_input_size,
+                "INFERENCE_CACHE_TABLE": inference_cache.table_name,
             }
         )
+        payloads.grant_read_write(m_od)
+        inference_cache.grant_read_write_data(m_od)
 
         od = tasks.LambdaInvoke(
             self, 'invoke-od',
@@ -69,6 +103,12 @@ class Image(Construct):
         )
 
         domain_objects = DomainState(self, 'domain-objects', stream=bus.stream, definition=definition,
+                                     layers=[bus.layer],
+                                     batch_size=max(5, micro_batch),
+                                     micro_batch=micro_batch,
+                                     dedup_version=model_package_version,
+                                     # the od handler accepts micro-batches
+                                     batched_definition=True,
                                      filters=[
                                          lambda_.FilterCriteria.filter(
                                              {
@@ -87,10 +127,12 @@ class Image(Construct):
 
         # vectors domain
         endpoint = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:endpoint/image-vector"
+        model_package_version = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:model-package/image-vector/1"
         m_vector = lambda_p.PythonFunction(
             self, 'm-vector',
             entry=F,
             index='image/vector.py',
+            layers=[bus.layer],
             runtime=lambda_.Runtime.PYTHON_3_12,
             memory_size=2048,
             timeout=Duration.seconds(120),
@@ -103,9 +145,15 @@ class Image(Construct):
             ],
             environment={
                 "ENDPOINT_NAME": "image-vector",
-                "MODEL_PACKAGE_VERSION": f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:model-package/image-vector/1"
+                "MODEL_PACKAGE_VERSION": model_package_version,
+                "BLOB_STORE": blob_store,
+                # images are downscaled to the input size of the vector model before inference
+                "ENDPOINT_INPUT_SIZE": vector_input_size,
+                "INFERENCE_CACHE_TABLE": inference_cache.table_name,
             }
         )
+        payloads.grant_read_write(m_vector)
+        inference_cache.grant_read_write_data(m_vector)
         #
         vector = tasks.LambdaInvoke(
             self, 'invoke-vector',
@@ -136,6 +184,12 @@ class Image(Construct):
             p
         )
         domain_enrich = DomainState(self, 'domain-enrich', stream=bus.stream, definition=definition,
+                                    layers=[bus.layer],
+                                    batch_size=max(5, micro_batch),
+                                    micro_batch=micro_batch,
+                                    dedup_version=model_package_version,
+                                    # the vector handler accepts micro-batches, labels passes them through
+                                    batched_definition=True,
                                     filters=[
                                         lambda_.FilterCriteria.filter(
                                             {
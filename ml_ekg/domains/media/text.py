@@ -3,9 +3,12 @@
 from aws_cdk import (
     Aws,
     Duration,
+    RemovalPolicy,
+    aws_dynamodb as dynamodb,
     aws_iam as iam,
     aws_lambda as lambda_,
     aws_lambda_python_alpha as lambda_python,
+    aws_s3 as s3,
     aws_stepfunctions_tasks as tasks,
 )
 
@@ -20,17 +23,37 @@ class Text(Construct):
 
     def __init__(self, scope: Construct, construct_id: str,
                  bus: Bus,
+                 micro_batch: int = 0,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         F = os.path.dirname(functions.__file__)
 
         endpoint = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:endpoint/text-ner"
+        model_package_version = f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:model-package/text-ner/1"
+
+        # endpoint responses shared across containers, keyed by payload, endpoint and model version
+        inference_cache = dynamodb.Table(self, 'inference-cache',
+                                         partition_key=dynamodb.Attribute(name="pk",
+                                                                          type=dynamodb.AttributeType.STRING),
+                                         billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                                         time_to_live_attribute="expires",
+                                         removal_policy=RemovalPolicy.DESTROY,
+                                         )
+
+        # canonical entities shared by every container, so they resolve a mention to the same entity
+        resolution = s3.Bucket(self, 'resolution', encryption=s3.BucketEncryption.S3_MANAGED,
+                               enforce_ssl=True,
+                               block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                               removal_policy=RemovalPolicy.DESTROY,
+                               auto_delete_objects=True,
+                               )
 
         m_ner = lambda_python.PythonFunction(
             self, 'm-ner',
             entry=F,
             index='text/ner.py',
+            layers=[bus.layer],
             runtime=lambda_.Runtime.PYTHON_3_12,
             memory_size=2048,
             timeout=Duration.seconds(120),
@@ -43,9 +66,13 @@ class Text(Construct):
             ],
             environment={
                 "ENDPOINT_NAME": "text-ner",
-                "MODEL_PACKAGE_VERSION": f"arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:model-package/text-ner/1"
+                "MODEL_PACKAGE_VERSION": model_package_version,
+                "INFERENCE_CACHE_TABLE": inference_cache.table_name,
+                "RESOLUTION_STORE": f"s3://{resolution.bucket_name}/resolution",
             }
         )
+        inference_cache.grant_read_write_data(m_ner)
+        resolution.grant_read_write(m_ner)
 
         ner = tasks.LambdaInvoke(
             self, 'invoke-ner',
@@ -68,6 +95,12 @@ class Text(Construct):
         )
 
         domain = DomainState(self, 'domain-ner', stream=bus.stream, definition=definition,
+                             layers=[bus.layer],
+                             batch_size=max(5, micro_batch),
+                             micro_batch=micro_batch,
+                             dedup_version=model_package_version,
+                             # the ner handler accepts micro-batches
+                             batched_definition=True,
                              filters=[
                                  lambda_.FilterCriteria.filter(
                                      {
@@ -45,7 +45,8 @@ class Stack(Stack):
         bus.stream.grant_write(workbench.role)
 
         graph.subscribe(
-            stream=bus.stream
+            stream=bus.stream,
+            layers=[bus.layer]
         )
 
         # exports
@@ -9,12 +9,14 @@ from aws_cdk import (
 
 import os
 from ml_ekg.patterns import functions as F
+from ml_ekg.patterns import layer as L
 
 from constructs import Construct
 
 
 class Bus(Construct):
     def __init__(self, scope: Construct, construct_id: str,
+                 partition_key: str = "lineage",
                  **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
@@ -25,18 +27,29 @@ class Bus(Construct):
             encryption=kinesis.StreamEncryption.MANAGED,
         )
 
+        # shared event encoding for the producers and consumers of the bus
+        layer = lambda_p.PythonLayerVersion(
+            self, 'layer',
+            entry=os.path.dirname(L.__file__),
+            description='eventbus',
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_12, lambda_.Runtime.PYTHON_3_10],
+        )
+
         lambda_function_put_batch_to_stream = lambda_p.PythonFunction(
             self, 'put-batch',
             runtime=lambda_.Runtime.PYTHON_3_12,
             entry=os.path.dirname(F.__file__),
             memory_size=1024,
             index='put-batch.py',
+            layers=[layer],
             timeout=Duration.seconds(30),
             environment={
-                "STREAM": stream.stream_name
+                "STREAM": stream.stream_name,
+                "PARTITION_KEY": partition_key,
             }
         )
         stream.grant_write(lambda_function_put_batch_to_stream.role)
 
         self.stream = stream
+        self.layer = layer
         self.put_batch = lambda_function_put_batch_to_stream
@@ -19,7 +19,19 @@ class DomainState(Construct):
                  definition: sfn.IChainable,
                  filters: typing.Optional[typing.Sequence[typing.Mapping[str,typing.Any]]],
                  reserved_concurrency: int = 0,  # 50,
+                 layers: typing.Optional[typing.Sequence[lambda_.ILayerVersion]] = None,
+                 batch_size: int = 5,
+                 micro_batch: int = 0,
+                 batched_definition: bool = False,
+                 dedup_version: typing.Optional[str] = None,
                  **kwargs):
+        """
+        :param micro_batch: send up to this many events to a single execution as {"records": [Event.json]},
+            0 starts an execution per event
+        :param batched_definition: the definition accepts {"records": [Event.json]} itself, otherwise it is run
+            for each event of a micro-batch in a Map state
+        :param dedup_version: version of the model run by the definition, skip content it processed recently
+        """
         super().__init__(scope, construct_id, **kwargs)
 
         role = iam.Role(self,
@@ -46,6 +58,12 @@ class DomainState(Construct):
                         )
         self.role = role
 
+        if micro_batch > 0 and not batched_definition:
+            definition = sfn.Map(
+                self, 'records',
+                items_path="$.records",
+            ).item_processor(definition)
+
         log_dest = logs.LogGroup(
             self, f'{construct_id}-logs'
         )
@@ -68,6 +86,9 @@ class DomainState(Construct):
                                     stream=stream,
                                     sfn_arn=state.state_machine_arn,
                                     filters=filters,
-                                    batch_size=5,
+                                    batch_size=batch_size,
+                                    layers=layers,
+                                    micro_batch=micro_batch,
+                                    dedup_version=dedup_version,
                                     )
         self.ssfn = ssfn
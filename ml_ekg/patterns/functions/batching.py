@@ -0,0 +1,120 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import random
+import time
+
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecords.html
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1024 * 1024
+# errors worth retrying, anything else would fail again
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecords.html#API_PutRecords_Errors
+RETRYABLE_ERRORS = (
+    'ProvisionedThroughputExceededException',
+    'InternalFailure',
+    'KMSThrottlingException',
+)
+
+
+def record_size(entry):
+    """
+    Size of a PutRecords entry as counted against the stream limits (data blob plus partition key)
+    :param entry: dict(Data=bytes, PartitionKey=str)
+    :return: size in bytes
+    """
+    return len(entry['Data']) + len(entry['PartitionKey'].encode("utf-8"))
+
+
+def chunk_records(entries,
+                  max_records=MAX_RECORDS_PER_REQUEST,
+                  max_bytes=MAX_BYTES_PER_REQUEST,
+                  max_record_bytes=MAX_BYTES_PER_RECORD):
+    """
+    Split PutRecords entries into chunks that fit in a single request by record count and payload size.
+    Entries are kept in order and carry their position in the input so results can be reported per record.
+    :param entries: [dict(Data=bytes, PartitionKey=str)]
+    :param max_records: maximum number of records per request
+    :param max_bytes: maximum payload size per request
+    :param max_record_bytes: maximum size of a single record
+    :return: (chunks, oversized) chunks as lists of (index, entry), oversized as a list of (index, size)
+    """
+    chunks = []
+    oversized = []
+
+    chunk = []
+    chunk_bytes = 0
+    for i, entry in enumerate(entries):
+        size = record_size(entry)
+        if size > max_record_bytes:
+            oversized += [(i, size)]
+            continue
+        if chunk and (len(chunk) >= max_records or chunk_bytes + size > max_bytes):
+            chunks += [chunk]
+            chunk = []
+            chunk_bytes = 0
+        chunk += [(i, entry)]
+        chunk_bytes += size
+
+    if chunk:
+        chunks += [chunk]
+    return chunks, oversized
+
+
+def backoff(attempt, base=0.05, cap=2.0):
+    """
+    Exponential backoff with full jitter
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    :param attempt: number of attempts made so far
+    :param base: delay in seconds for the first retry
+    :param cap: upper bound for the delay in seconds
+    :return: delay in seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def put_with_retry(client, stream_name, chunk, deadline, base=0.05, cap=2.0):
+    """
+    Put a chunk of entries to the stream, resending only the entries the stream rejected with a retryable error
+    until they are all accepted or the deadline passes. A request failing with any other error is raised.
+    :param client: boto3 kinesis client
+    :param stream_name: name of the stream
+    :param chunk: [(index, entry)] as returned by chunk_records
+    :param deadline: time.monotonic() value after which no further attempt is started
+    :param base: delay in seconds for the first retry
+    :param cap: upper bound for the delay in seconds
+    :return: {index: result} with result either {SequenceNumber, ShardId} or {ErrorCode, ErrorMessage}
+    """
+    results = {}
+    pending = chunk
+    attempt = 0
+    while pending:
+        try:
+            response = client.put_records(
+                StreamName=stream_name,
+                Records=[entry for _, entry in pending]
+            )
+            retry = []
+            for (i, entry), result in zip(pending, response['Records']):
+                results[i] = result
+                if result.get('ErrorCode') in RETRYABLE_ERRORS:
+                    retry += [(i, entry)]
+        except Exception as e:
+            if error_code(e) not in RETRYABLE_ERRORS:
+                raise
+            # nothing was acknowledged, every pending entry is retried
+            for i, _ in pending:
+                results[i] = {"ErrorCode": error_code(e), "ErrorMessage": str(e)}
+            retry = pending
+
+        pending = retry
+        if pending:
+            delay = backoff(attempt, base=base, cap=cap)
+            if time.monotonic() + delay > deadline:
+                break
+            time.sleep(delay)
+            attempt += 1
+    return results
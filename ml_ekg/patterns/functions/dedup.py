@@ -0,0 +1,134 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import collections
+import json
+import threading
+import time
+
+
+class LocalStore(object):
+    """
+    In memory stand-in for the shared store
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def get(self, key):
+        expires = self.items.get(key)
+        return expires is not None and expires > time.time()
+
+    def put(self, key, ttl):
+        self.items[key] = time.time() + ttl
+
+
+class DynamoDBStore(object):
+    """
+    Keys shared across containers in a DynamoDB table with time to live enabled on the 'expires' attribute
+    """
+
+    def __init__(self, table_name, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("dynamodb")
+        self.client = client
+        self.table_name = table_name
+
+    def get(self, key):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"pk": {"S": key}},
+        )
+        item = response.get('Item')
+        # expired items are deleted lazily by DynamoDB
+        return item is not None and float(item['expires']['N']) > time.time()
+
+    def put(self, key, ttl):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "pk": {"S": key},
+                "expires": {"N": str(int(time.time() + ttl))}
+            }
+        )
+
+
+class Deduplicator(object):
+    """
+    Remember which content was recently processed by a model version, first in an LRU kept by the warm
+    container, then in an optional shared store.
+    """
+
+    def __init__(self, version, ttl=3600, size=10000, store=None):
+        self.version = version
+        self.ttl = ttl
+        self.size = size
+        self.store = store
+        self.lru = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def key(self, id_):
+        return f"{self.version}:{id_}"
+
+    def seen(self, id_):
+        key = self.key(id_)
+        now = time.time()
+        with self.lock:
+            self.stats['checked'] += 1
+            expires = self.lru.get(key)
+            if expires is not None:
+                if expires > now:
+                    self.lru.move_to_end(key)
+                    self.stats['hits_local'] += 1
+                    return True
+                del self.lru[key]
+
+        if self.store is not None:
+            try:
+                if self.store.get(key):
+                    self.stats['hits_shared'] += 1
+                    self.remember(key, now + self.ttl)
+                    return True
+            except Exception as e:
+                # the shared store is an optimisation, never block processing on it
+                print("Error reading dedup store:", e)
+                self.stats['errors'] += 1
+        return False
+
+    def remember(self, key, expires):
+        with self.lock:
+            self.lru[key] = expires
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.size:
+                self.lru.popitem(last=False)
+
+    def mark(self, id_):
+        key = self.key(id_)
+        self.remember(key, time.time() + self.ttl)
+        if self.store is not None:
+            try:
+                self.store.put(key, self.ttl)
+            except Exception as e:
+                print("Error writing dedup store:", e)
+                self.stats['errors'] += 1
+
+    def metrics(self, namespace, **dimensions):
+        """
+        Counters as a CloudWatch embedded metric format log line
+        https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+        """
+        names = ['checked', 'hits_local', 'hits_shared', 'skipped', 'errors']
+        doc = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": "Count"} for name in names]
+                }]
+            }
+        }
+        doc.update(dimensions)
+        doc.update({name: self.stats[name] for name in names})
+        return json.dumps(doc)
@@ -0,0 +1,86 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import collections
+import hashlib
+import uuid
+
+# random: a new uuid per record, spread evenly but unrelated events land on different shards
+# id: the ~id of the event
+# lineage: the ~id of the oldest ancestor found in the batch, so a document, its derived vertices and their
+#          lineage edges share a shard
+# source: the event source, e.g. graph.vertex or ml.cv.od.person
+STRATEGIES = ('random', 'id', 'lineage', 'source')
+
+
+def record_id(record):
+    detail = record.get('detail', {})
+    return detail.get('metadata', {}).get('~id') or detail.get('data', {}).get('~id')
+
+
+def lineage(records):
+    """
+    Map each vertex id to its parent using the lineage edges present in the batch
+    :param records: [Event.json]
+    :return: {child ~id: parent ~id}
+    """
+    parents = {}
+    for record in records:
+        data = record.get('detail', {}).get('data', {})
+        if isinstance(data, dict) and '~from' in data and '~to' in data and data['~from'] != data['~to']:
+            parents[data['~from']] = data['~to']
+    return parents
+
+
+def root(id_, parents):
+    seen = set()
+    while id_ in parents and id_ not in seen:
+        seen.add(id_)
+        id_ = parents[id_]
+    return id_
+
+
+def partition_key(record, strategy, parents):
+    if strategy == 'source':
+        return record.get('source')
+    if strategy == 'id':
+        return record_id(record)
+    if strategy == 'lineage':
+        data = record.get('detail', {}).get('data', {})
+        if isinstance(data, dict) and '~from' in data:
+            return root(data['~from'], parents)
+        id_ = record_id(record)
+        return root(id_, parents) if id_ else None
+    return None
+
+
+def salt(key, record, index, buckets):
+    seed = record_id(record) or str(index)
+    bucket = int(hashlib.md5(seed.encode("utf-8")).hexdigest(), 16) % buckets
+    return f"{key}#{bucket}"
+
+
+def partition_keys(records, strategy='lineage', salt_buckets=1, hot_key_threshold=0):
+    """
+    Assign a partition key to each record so related events share a shard.
+    Keys used by more than hot_key_threshold records in the batch are spread over salt_buckets shards by
+    suffixing a salt derived from the record id, so the same record always maps to the same salted key.
+    :param records: [Event.json]
+    :param strategy: one of STRATEGIES
+    :param salt_buckets: number of salted keys a hot key is spread over, 1 disables salting
+    :param hot_key_threshold: number of records sharing a key above which the key is salted
+    :return: [str] aligned with records
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown partition key strategy {strategy}, expected one of {STRATEGIES}")
+
+    parents = lineage(records) if strategy == 'lineage' else {}
+    keys = [partition_key(record, strategy, parents) for record in records]
+    keys = [key if key else str(uuid.uuid4()) for key in keys]
+
+    if salt_buckets > 1:
+        counts = collections.Counter(keys)
+        keys = [
+            salt(key, record, i, salt_buckets) if counts[key] > hot_key_threshold else key
+            for i, (key, record) in enumerate(zip(keys, records))
+        ]
+    return keys
@@ -2,29 +2,140 @@
 
 import boto3
 import json
-import uuid
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import chunk_records, put_with_retry, MAX_BYTES_PER_RECORD
+from partition import partition_keys
+from eventbus.aggregate import aggregate, AGGREGATED
+from eventbus import codec, serde
 
 kinesis = boto3.client("kinesis")
 STREAM_NAME = os.environ["STREAM"]
+MAX_RECORD_BYTES = int(os.environ.get("MAX_RECORD_BYTES", MAX_BYTES_PER_RECORD))
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "8"))
+# time spent retrying throttled records, bounded by the remaining invocation time
+RETRY_BUDGET_SECONDS = float(os.environ.get("RETRY_BUDGET_SECONDS", "20"))
+RETRY_MARGIN_SECONDS = 2.0
+# see partition.STRATEGIES
+PARTITION_KEY = os.environ.get("PARTITION_KEY", "lineage")
+PARTITION_SALT_BUCKETS = int(os.environ.get("PARTITION_SALT_BUCKETS", "4"))
+PARTITION_HOT_KEY_THRESHOLD = int(os.environ.get("PARTITION_HOT_KEY_THRESHOLD", "250"))
+# comma separated source prefixes of the events packed into aggregated records, empty to disable
+AGGREGATE_SOURCES = tuple(p for p in os.environ.get("AGGREGATE_SOURCES", "graph.").split(",") if p)
+AGGREGATE_MAX_BYTES = int(os.environ.get("AGGREGATE_MAX_BYTES", 128 * 1024))
+AGGREGATE_MAX_RECORDS = int(os.environ.get("AGGREGATE_MAX_RECORDS", "200"))
+# see codec.CODECS, records below CODEC_MIN_BYTES are sent uncompressed
+CODEC = os.environ.get("CODEC", "zstd")
+CODEC_MIN_BYTES = int(os.environ.get("CODEC_MIN_BYTES", "4096"))
+
+
+class RecordsNotPut(Exception):
+    """
+    Records still rejected by the stream once the retry budget is used, fails the execution so the events are
+    retried from the start
+    """
 
 
 def encode_record(record):
-    data = json.dumps(record)
-    data = data.encode("utf-8")
-    return dict(
-        Data=data,
-        PartitionKey=str(uuid.uuid4())
-    )
+    return serde.dumps(record)
+
+
+def compress(data, records, indices):
+    record = records[indices[0]]
+    detail_type = AGGREGATED if len(indices) > 1 else record.get('detail-type')
+    return codec.encode(data, record.get('source'), detail_type, codec=CODEC, min_bytes=CODEC_MIN_BYTES)
+
+
+def describe_record(record, index, size):
+    """
+    Identify a record that could not be sent without repeating its payload
+    """
+    return {
+        "index": index,
+        "source": record.get('source'),
+        "~id": record.get('detail', {}).get('metadata', {}).get('~id'),
+        "size": size
+    }
+
+
+def get_deadline(context):
+    budget = RETRY_BUDGET_SECONDS
+    if context is not None:
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000 - RETRY_MARGIN_SECONDS)
+    return time.monotonic() + budget
+
+
+def record_status(result):
+    if 'ErrorCode' in result:
+        return {
+            "status": "failed",
+            "errorCode": result['ErrorCode'],
+            "errorMessage": result.get('ErrorMessage')
+        }
+    return {
+        "status": "ok",
+        "shardId": result['ShardId'],
+        "sequenceNumber": result['SequenceNumber']
+    }
 
 
 def handler(event, context):
+    """
+    Put records to the stream, retrying records rejected by the stream.
+    Raises RecordsNotPut when records are still rejected once the retry budget is used, oversized records can
+    never be put and are only reported.
+    :param event: {"records": [Event.json]}
+    :param context:
+    :return: counts, number of stream records used and per-record status aligned with event['records']
+    """
     records = event['records']
-    if len(records) > 0:
-        response = kinesis.put_records(
-            StreamName=STREAM_NAME,
-            Records=[
-                encode_record(record)
-                for record in records
-            ]
-        )
+    keys = partition_keys(records, strategy=PARTITION_KEY,
+                          salt_buckets=PARTITION_SALT_BUCKETS,
+                          hot_key_threshold=PARTITION_HOT_KEY_THRESHOLD)
+    encoded = [(record.get('source'), encode_record(record)) for record in records]
+    groups = aggregate(encoded, keys, sources=AGGREGATE_SOURCES,
+                       max_bytes=AGGREGATE_MAX_BYTES, max_records=AGGREGATE_MAX_RECORDS)
+    entries = [
+        dict(Data=compress(data, records, indices), PartitionKey=key)
+        for indices, data, key in groups
+    ]
+    chunks, oversized = chunk_records(entries, max_record_bytes=MAX_RECORD_BYTES)
+    deadline = get_deadline(context)
+
+    results = {}
+    if len(chunks) > 0:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(chunks))) as pool:
+            for r in pool.map(lambda chunk: put_with_retry(kinesis, STREAM_NAME, chunk, deadline), chunks):
+                results.update(r)
+
+    # an aggregated entry carries several events, they share its result
+    status = [None] * len(records)
+    for i, result in results.items():
+        for j in groups[i][0]:
+            status[j] = dict(index=j, **record_status(result))
+
+    # every event of an oversized aggregated entry is reported
+    oversized = [describe_record(records[j], j, size) for i, size in oversized for j in groups[i][0]]
+    for o in oversized:
+        print("Record too large for the stream:", json.dumps(o))
+        status[o['index']] = dict(o, status="oversized")
+
+    failed = [s for s in status if s['status'] == 'failed']
+    for f in failed:
+        print("Record not accepted by the stream:", json.dumps(describe_record(records[f['index']], f['index'], None)),
+              f['errorCode'])
+
+    out = {
+        "records": len(records),
+        "entries": len(entries),
+        "sent": len(records) - len(failed) - len(oversized),
+        "failed": len(failed),
+        "oversized": len(oversized),
+        "partial": len(failed) + len(oversized) > 0,
+        "results": status
+    }
+    if failed:
+        raise RecordsNotPut(json.dumps({k: v for k, v in out.items() if k != 'results'}))
+    return out
@@ -2,13 +2,44 @@
 
 import boto3
 import base64
-import json
 import os
 import traceback
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from eventbus.aggregate import deaggregate
+from eventbus import codec, serde
+from dedup import Deduplicator, DynamoDBStore
 
-sfn = boto3.client("stepfunctions")
 ARN = os.environ['STEPFUNCTION']
 SYNC = os.environ.get("SYNC", "TRUE")
+# number of executions started at the same time
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "10"))
+# maximum number of events sent as {"records": [...]} to a single execution, 0 starts one execution per event
+MICRO_BATCH = int(os.environ.get("MICRO_BATCH", "0"))
+# keep micro-batches below the 256 KiB execution input limit
+MICRO_BATCH_MAX_BYTES = int(os.environ.get("MICRO_BATCH_MAX_BYTES", 200 * 1024))
+# skip events whose ~id was processed by this model version within DEDUP_TTL seconds, unset to disable
+DEDUP_VERSION = os.environ.get("DEDUP_VERSION")
+DEDUP_TTL = int(os.environ.get("DEDUP_TTL", "3600"))
+DEDUP_LRU_SIZE = int(os.environ.get("DEDUP_LRU_SIZE", "10000"))
+DEDUP_TABLE = os.environ.get("DEDUP_TABLE")
+
+sfn = boto3.client("stepfunctions", config=Config(max_pool_connections=CONCURRENCY))
+dedup = Deduplicator(
+    DEDUP_VERSION, ttl=DEDUP_TTL, size=DEDUP_LRU_SIZE,
+    store=DynamoDBStore(DEDUP_TABLE) if DEDUP_TABLE else None
+) if DEDUP_VERSION else None
+
+
+def execution_name(seq, i=0):
+    """
+    Partition keys are shared by related records and may contain characters not allowed in execution names,
+    name executions after the record sequence number and the position of the event in the record instead.
+    https://docs.aws.amazon.com/step-functions/latest/apireference/API_StartExecution.html#StepFunctions-StartExecution-request-name
+    """
+    suffix = f"-{i}" if i else ""
+    return seq[-(80 - len(suffix)):] + suffix
 
 
 def parse_json(record):
@@ -16,9 +47,8 @@ def parse_json(record):
     seq = record['kinesis']['sequenceNumber']
     data = record['kinesis']['data']
     data = base64.b64decode(data)
-    data = data.decode("utf-8")
-    doc = json.loads(data)
-    return id_, doc, seq
+    doc, data = codec.decode_bytes(data)
+    return id_, doc, seq, data
 
 
 def parse_batched_record(record):
@@ -28,26 +58,117 @@ def parse_batched_record(record):
     return id_, data, seq
 
 
+def start(name, input_):
+    """
+    :param name: execution name
+    :param input_: JSON encoded execution input
+    """
+    if SYNC == 'TRUE':
+        return sfn.start_sync_execution(
+            stateMachineArn=ARN,
+            name=name,
+            input=input_,
+        )
+    return sfn.start_execution(
+        stateMachineArn=ARN,
+        name=name,
+        input=input_,
+    )
+
+
+def micro_batches(executions, max_records, max_bytes):
+    """
+    Group single event executions into executions of {"records": [Event.json]}
+    :param executions: [(seqs, name, input_, ids)]
+    :param max_records: maximum number of events per execution
+    :param max_bytes: maximum size of the execution input
+    :return: [(seqs, name, input_, ids)] named after the first event of each micro-batch
+    """
+    out = []
+    batch = []
+    size = 0
+    for execution in executions:
+        _, _, input_, _ = execution
+        if batch and (len(batch) >= max_records or size + len(input_) + 1 > max_bytes):
+            out += [batch]
+            batch = []
+            size = 0
+        batch += [execution]
+        size += len(input_) + 1
+    if batch:
+        out += [batch]
+
+    return [
+        (
+            set().union(*[seqs for seqs, _, _, _ in batch]),
+            batch[0][1],
+            '{"records": [' + ",".join(input_ for _, _, input_, _ in batch) + ']}',
+            set().union(*[ids for _, _, _, ids in batch]),
+        )
+        for batch in out
+    ]
+
+
+def content_id(doc):
+    return doc.get('detail', {}).get('metadata', {}).get('~id')
+
+
 def handler(event, context):
+    executions = []
+    pending = set()
     for record in event['Records']:
-        id_, input_, seq = parse_json(record)
+        id_, doc, seq, data = parse_json(record)
         # id_, input_ = parse_batched_record(record)
         # print(id_)
-        if SYNC == 'TRUE':
-            try:
-                response = sfn.start_sync_execution(
-                    stateMachineArn=ARN,
-                    name=id_,
-                    input=json.dumps(input_),
-                )
-            except Exception as e:
-                print("Error starting stepfunction")
-                print(traceback.format_exc())
-                return {"batchItemFailures": [{"itemIdentifier": seq}]}
-        else:
-            response = sfn.start_execution(
-                stateMachineArn=ARN,
-                name=id_,
-                input=json.dumps(input_),
-            )
-    return {"batchItemFailures": []}
+        events = deaggregate(doc)
+        for i, input_ in enumerate(events):
+            cid = content_id(input_)
+            if dedup is not None and cid:
+                # skip content processed recently or already in this batch
+                if cid in pending or dedup.seen(cid):
+                    dedup.stats['skipped'] += 1
+                    continue
+                pending.add(cid)
+            # forward a record that carries a single event as is, without re-encoding it
+            input_ = serde.as_str(data) if events[0] is doc else serde.dumps_str(input_)
+            executions += [({seq}, execution_name(seq, i), input_, {cid} if cid else set())]
+
+    if MICRO_BATCH > 0:
+        executions = micro_batches(executions, MICRO_BATCH, MICRO_BATCH_MAX_BYTES)
+
+    failed = set()
+    if len(executions) > 0:
+        with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(executions))) as pool:
+            futures = {
+                pool.submit(start, name, input_): (seqs, ids)
+                for seqs, name, input_, ids in executions
+            }
+            for future in as_completed(futures):
+                seqs, ids = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print("Error starting stepfunction")
+                    print("".join(traceback.format_exception(e)))
+                    failed.update(seqs)
+                    continue
+                # asynchronous starts have no status, the records of a failed synchronous execution are retried
+                status = response.get('status', 'SUCCEEDED')
+                if status != 'SUCCEEDED':
+                    print("Execution", status, response.get('error'), response.get('cause'))
+                    failed.update(seqs)
+                    continue
+                if dedup is not None:
+                    for cid in ids:
+                        dedup.mark(cid)
+
+    if dedup is not None:
+        print(dedup.metrics("ml-ekg/dedup", version=DEDUP_VERSION))
+        dedup.stats.clear()
+
+    # report every failed record, in stream order
+    return {"batchItemFailures": [
+        {"itemIdentifier": record['kinesis']['sequenceNumber']}
+        for record in event['Records']
+        if record['kinesis']['sequenceNumber'] in failed
+    ]}
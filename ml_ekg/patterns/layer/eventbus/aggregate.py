@@ -0,0 +1,81 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from . import serde
+
+# detail-type of a record that packs several events of the same source
+AGGREGATED = "aggregated"
+
+# the aggregated record is a JSON event itself so Lambda event filters on data.source keep matching
+_PREFIX = b'{"source": %s, "detail-type": "' + AGGREGATED.encode("utf-8") + b'", "detail": {"metadata": {"count": %d}, "records": ['
+_SUFFIX = b']}}'
+
+
+def aggregate_record(source, members):
+    """
+    Pack already encoded events of the same source into a single record
+    :param source: source shared by the events
+    :param members: [bytes] JSON encoded events
+    :return: bytes
+    """
+    prefix = _PREFIX % (serde.dumps(source), len(members))
+    return prefix + b','.join(members) + _SUFFIX
+
+
+def aggregate(encoded, keys, sources=("graph.",), max_bytes=128 * 1024, max_records=200):
+    """
+    Pack small events into aggregated records by source and partition key, in the spirit of the Kinesis Producer
+    Library. Only events sharing a partition key are packed together so an aggregated record keeps their key and
+    the lineage co-location and salting of partition.partition_keys.
+    Events whose source does not start with one of the given prefixes are passed through unchanged.
+    :param encoded: [(source, bytes)] JSON encoded events
+    :param keys: [str] partition keys aligned with encoded
+    :param sources: source prefixes of the events to aggregate
+    :param max_bytes: maximum size of an aggregated record
+    :param max_records: maximum number of events in an aggregated record
+    :return: [(indices, bytes, key)] indices of the events packed in each record
+    """
+    out = []
+    open_ = {}
+
+    def close(group):
+        indices, members, _ = open_.pop(group)
+        if len(members) == 1:
+            out.append((indices, members[0], group[1]))
+        else:
+            out.append((indices, aggregate_record(group[0], members), group[1]))
+
+    for i, (source, data) in enumerate(encoded):
+        source = source or ''
+        if not any(source.startswith(prefix) for prefix in sources) or len(data) + len(_PREFIX) + len(_SUFFIX) > max_bytes:
+            out.append(([i], data, keys[i]))
+            continue
+        group = (source, keys[i])
+        if group in open_:
+            indices, members, size = open_[group]
+            if len(members) >= max_records or size + len(data) + 1 > max_bytes:
+                close(group)
+        if group not in open_:
+            open_[group] = ([], [], len(_PREFIX) + len(source) + len(_SUFFIX) + 8)
+        indices, members, size = open_[group]
+        indices.append(i)
+        members.append(data)
+        open_[group] = (indices, members, size + len(data) + 1)
+
+    for group in list(open_):
+        close(group)
+    return out
+
+
+def is_aggregated(doc):
+    return doc.get('detail-type') == AGGREGATED and 'records' in doc.get('detail', {})
+
+
+def deaggregate(doc):
+    """
+    Unpack an aggregated record into its events, any other event is returned as the only element
+    :param doc: decoded record
+    :return: [Event.json]
+    """
+    if is_aggregated(doc):
+        return doc['detail']['records']
+    return [doc]
@@ -0,0 +1,95 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import base64
+import gzip
+
+from . import serde
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, gzip is always available
+    zstandard = None
+
+# version of the compressed envelope
+VERSION = 1
+CODECS = ('zstd', 'gzip', 'none')
+
+
+def available(codec):
+    if codec == 'zstd':
+        return zstandard is not None
+    return codec in CODECS
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Record is zstd compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    raise ValueError(f"Unknown codec {codec}")
+
+
+def encode(data, source, detail_type=None, codec='zstd', min_bytes=4096):
+    """
+    Compress a JSON encoded event into an envelope that keeps the source and detail-type readable, so Lambda
+    event filters on data.source still match.
+    Events smaller than min_bytes, or that do not get smaller, are returned unchanged.
+    :param data: bytes, JSON encoded event
+    :param source: source of the event
+    :param detail_type: detail-type of the event
+    :param codec: zstd, gzip or none, zstd falls back to gzip when zstandard is not installed
+    :param min_bytes: events below this size are not compressed
+    :return: bytes
+    """
+    if codec == 'none' or len(data) < min_bytes:
+        return data
+    if not available(codec):
+        codec = 'gzip'
+
+    payload = base64.b64encode(compress(data, codec)).decode("utf-8")
+    envelope = serde.dumps({
+        "source": source,
+        "detail-type": detail_type,
+        "encoding": {"v": VERSION, "codec": codec},
+        "payload": payload
+    })
+    return envelope if len(envelope) < len(data) else data
+
+
+def is_encoded(doc):
+    return isinstance(doc, dict) and 'encoding' in doc and 'payload' in doc and 'detail' not in doc
+
+
+def decode_bytes(data):
+    """
+    Decode a record written by encode, plain JSON events are decoded as is
+    :param data: bytes
+    :return: (event, bytes) the event and its plain JSON encoding, which can be forwarded without re-encoding
+    """
+    doc = serde.loads(data)
+    if not is_encoded(doc):
+        return doc, data
+    encoding = doc['encoding']
+    if encoding.get('v') != VERSION:
+        raise ValueError(f"Unsupported envelope version {encoding.get('v')}")
+    data = decompress(base64.b64decode(doc['payload']), encoding['codec'])
+    return serde.loads(data), data
+
+
+def decode(data):
+    """
+    Decode a record written by encode, plain JSON events are decoded as is
+    :param data: bytes
+    :return: event
+    """
+    return decode_bytes(data)[0]
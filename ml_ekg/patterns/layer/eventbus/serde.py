@@ -0,0 +1,80 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library is used without it
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj):
+    """
+    :param obj: JSON serializable object
+    :return: bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def dumps_str(obj):
+    """
+    :param obj: JSON serializable object
+    :return: str, e.g. for Step Functions execution input
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj)
+
+
+def loads(data):
+    """
+    :param data: bytes or str
+    :return: object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def as_str(data):
+    """
+    JSON bytes that need no change, as a str without a loads/dumps round trip
+    """
+    return data.decode("utf-8") if isinstance(data, (bytes, bytearray, memoryview)) else data
+
+
+if __name__ == '__main__':
+    # microbenchmark on an object detection sized event: python -m eventbus.serde
+    import base64
+    import os
+    import random
+    import timeit
+
+    event = {
+        "source": "ml.cv.od.person",
+        "detail-type": "objectDetected",
+        "detail": {
+            "metadata": {"~id": "0" * 32, "~type": "person"},
+            "data": {
+                "confidence:Double": 0.9,
+                "bbox": [random.random() for _ in range(4)],
+                "embeddings": [random.random() for _ in range(2048)],
+                "payload": base64.b64encode(os.urandom(48 * 1024)).decode("utf-8")
+            }
+        }
+    }
+    data = json.dumps(event).encode("utf-8")
+    n = 200
+
+    def report(name, f):
+        print(f"{name:<40}{timeit.timeit(f, number=n) / n * 1e6:>10.1f} us")
+
+    print(f"event size {len(data)} bytes, backend {BACKEND}")
+    report("json loads + dumps", lambda: json.dumps(json.loads(data)))
+    if orjson is not None:
+        report("orjson loads + dumps", lambda: orjson.dumps(orjson.loads(data)).decode("utf-8"))
+    report("pass-through as_str", lambda: as_str(data))
@@ -5,6 +5,8 @@ from aws_cdk import (
     aws_lambda as lambda_,
     aws_lambda_python_alpha as lambda_p,
     aws_iam as iam,
+    aws_dynamodb as dynamodb,
+    RemovalPolicy,
     aws_kinesis as kinesis,
     aws_lambda_event_sources as event_sources,
 )
@@ -23,7 +25,15 @@ class StreamedStepFunction(Construct):
                  stream: kinesis.Stream,
                  filters: typing.Optional[typing.Sequence[typing.Mapping[str,typing.Any]]],
                  batch_size: int = 100,
+                 layers: typing.Optional[typing.Sequence[lambda_.ILayerVersion]] = None,
+                 concurrency: int = 10,
+                 micro_batch: int = 0,
+                 dedup_version: typing.Optional[str] = None,
+                 dedup_ttl: Duration = Duration.hours(1),
                  **kwargs):
+        """
+        :param dedup_version: skip events whose ~id was processed by this model version within dedup_ttl
+        """
         super().__init__(scope, id, **kwargs)
 
         lambda_function = lambda_p.PythonFunction(
@@ -32,6 +42,7 @@ class StreamedStepFunction(Construct):
             entry=os.path.dirname(F.__file__),
             memory_size=128,
             index='stream.py',
+            layers=layers,
             timeout=Duration.seconds(60),
             initial_policy=[
                 # https://docs.aws.amazon.com/step-functions/latest/dg/concept-create-iam-advanced.html
@@ -49,17 +60,35 @@ class StreamedStepFunction(Construct):
                 )
             ],
             environment={
-                "STEPFUNCTION": sfn_arn
+                "STEPFUNCTION": sfn_arn,
+                "CONCURRENCY": str(concurrency),
+                "MICRO_BATCH": str(micro_batch),
             }
         )
         stream.grant_read(lambda_function.role)
 
+        if dedup_version:
+            # share recently processed content ids across containers
+            table = dynamodb.Table(
+                self, 'dedup',
+                partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            table.grant_read_write_data(lambda_function)
+            lambda_function.add_environment("DEDUP_VERSION", dedup_version)
+            lambda_function.add_environment("DEDUP_TTL", str(int(dedup_ttl.to_seconds())))
+            lambda_function.add_environment("DEDUP_TABLE", table.table_name)
+
         lambda_function.add_event_source(event_sources.KinesisEventSource(
             stream,
             starting_position=lambda_.StartingPosition.LATEST,
             batch_size=batch_size,
             retry_attempts=3,
             bisect_batch_on_error=True,
+            # retry only the records stream.py reports in batchItemFailures
+            report_batch_item_failures=True,
             filters=filters
         )
         )
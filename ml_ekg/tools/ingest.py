@@ -0,0 +1,377 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+"""
+Bulk ingestion of a corpus onto the bus
+
+    python -m ml_ekg.tools.ingest ./corpus --stream <stream name> --checkpoint ingest.ckpt
+    python -m ml_ekg.tools.ingest --manifest files.txt --local events.jsonl
+
+Files stream through a generator pipeline: read, md5, Event envelope, size aware batches. Batches are put
+concurrently, the number of batches in flight halves when the stream throttles and grows back by one after
+each batch put without throttling. Files put are appended to the checkpoint so an interrupted run resumes where
+it stopped.
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+
+from ml_ekg.patterns.functions.batching import (
+    MAX_RECORDS_PER_REQUEST,
+    MAX_BYTES_PER_REQUEST,
+    MAX_BYTES_PER_RECORD,
+    record_size,
+    put_with_retry,
+)
+from ml_ekg.patterns.functions.partition import partition_key
+from ml_ekg.patterns.layer.eventbus import serde
+
+THROTTLED = 'ProvisionedThroughputExceededException'
+
+# detail-type of the content events consumed by the media domains
+DETAIL_TYPES = {
+    'image': 'imageCreated',
+    'text': 'textExtracted',
+}
+
+
+def walk(root):
+    """
+    Files under a directory, in a stable order so runs over the same tree see the same sequence
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def read_manifest(path):
+    """
+    Files listed in a manifest, one path per line or JSON lines with a "path" field
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                line = json.loads(line)['path']
+            yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+def skip_done(paths, done):
+    for path in paths:
+        if path not in done:
+            yield path
+
+
+def read(paths):
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield path, f.read()
+
+
+def content_label(path):
+    """
+    :return: source of the content event from the file type, e.g. content.image.jpeg or content.text.plain
+    """
+    mime, _ = mimetypes.guess_type(path)
+    mime = mime or 'application/octet-stream'
+    return f"content.{mime.replace('/', '.')}"
+
+
+def to_events(files, blob_store=None, claim_check_bytes=32 * 1024):
+    """
+    :param files: (path, bytes)
+    :param blob_store: store of the payloads above claim_check_bytes, as in the media functions
+    :return: (path, Event.json)
+    """
+    for path, data in files:
+        md5 = hashlib.md5(data).hexdigest()
+        source = content_label(path)
+        kind = source.split('.')[1]
+        if kind not in DETAIL_TYPES:
+            print(f"Skipping {path}: unsupported content type {source}")
+            continue
+
+        if kind == 'text':
+            payload = {"payload": data.decode("utf-8", errors="replace")}
+        elif blob_store is not None and len(data) > claim_check_bytes:
+            payload = {"payloadRef": blob_store.put(md5, data), "payloadSize": len(data)}
+        else:
+            payload = {"payload": base64.b64encode(data).decode("utf-8")}
+
+        yield path, {
+            "source": source,
+            "detail-type": DETAIL_TYPES[kind],
+            "detail": {
+                "metadata": {
+                    "~id": md5,
+                    "uri": f"file://{os.path.abspath(path)}",
+                    "size": len(data),
+                },
+                "data": payload,
+            },
+        }
+
+
+def encode(events):
+    """
+    :param events: (path, Event.json)
+    :return: (path, dict(Data=bytes, PartitionKey=str)), keyed like put-batch keys a root event
+    """
+    for path, event in events:
+        yield path, dict(Data=serde.dumps(event), PartitionKey=partition_key(event, 'lineage', {}))
+
+
+def batches(entries, max_records=MAX_RECORDS_PER_REQUEST, max_bytes=MAX_BYTES_PER_REQUEST,
+            max_record_bytes=MAX_BYTES_PER_RECORD, oversized=None):
+    """
+    Group entries into PutRecords requests by count and size, without reading ahead more than one request
+    :param entries: (path, entry)
+    :param oversized: list collecting (path, size) of the entries above max_record_bytes
+    :return: [(path, entry)]
+    """
+    batch = []
+    size = 0
+    for path, entry in entries:
+        entry_size = record_size(entry)
+        if entry_size > max_record_bytes:
+            print(f"Skipping {path}: {entry_size} bytes is above the {max_record_bytes} bytes record limit")
+            if oversized is not None:
+                oversized.append((path, entry_size))
+            continue
+        if batch and (len(batch) >= max_records or size + entry_size > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append((path, entry))
+        size += entry_size
+    if batch:
+        yield batch
+
+
+class Backpressure(object):
+    """
+    Limit on the batches in flight, halved on throttling and increased by one after a batch put without it
+    """
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.limit = max_in_flight
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+            else:
+                self.limit = min(self.max_in_flight, self.limit + 1)
+            self.condition.notify_all()
+
+
+class ThrottleCounter(object):
+    """
+    Client wrapper counting the records the stream throttled, including the retries put_with_retry makes
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.local = threading.local()
+
+    @property
+    def throttled(self):
+        return getattr(self.local, 'throttled', 0)
+
+    @throttled.setter
+    def throttled(self, value):
+        self.local.throttled = value
+
+    def put_records(self, **kwargs):
+        response = self.client.put_records(**kwargs)
+        self.throttled += sum(1 for r in response['Records'] if r.get('ErrorCode') == THROTTLED)
+        return response
+
+
+class LocalStream(object):
+    """
+    Stand-in for a Kinesis stream appending records as JSON lines, with optional throttling for tests
+    """
+
+    def __init__(self, path=None, shards=1, throttle_every=0):
+        """
+        :param path: file the records are appended to, None keeps them in memory only
+        :param shards: number of shards the partition keys hash to
+        :param throttle_every: reject every n-th record as throttled, 0 never throttles
+        """
+        self.path = path
+        self.shards = shards
+        self.throttle_every = throttle_every
+        self.records = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def put_records(self, StreamName, Records):
+        out = []
+        failed = 0
+        with self.lock:
+            lines = []
+            for record in Records:
+                self.count += 1
+                if self.throttle_every and self.count % self.throttle_every == 0:
+                    out.append({"ErrorCode": THROTTLED, "ErrorMessage": "Rate exceeded for shard"})
+                    failed += 1
+                    continue
+                shard = int(hashlib.md5(record['PartitionKey'].encode("utf-8")).hexdigest(), 16) % self.shards
+                sequence = str(len(self.records)).zfill(20)
+                self.records.append(record)
+                lines.append(serde.dumps_str({"PartitionKey": record['PartitionKey'], "ShardId": shard,
+                                              "SequenceNumber": sequence,
+                                              "Data": serde.loads(record['Data'])}))
+                out.append({"ShardId": f"shardId-{shard:012d}", "SequenceNumber": sequence})
+            if self.path and lines:
+                with open(self.path, 'a') as f:
+                    f.write('\n'.join(lines) + '\n')
+        return {"FailedRecordCount": failed, "Records": out}
+
+
+class Checkpoint(object):
+    """
+    Append-only file of the paths already put, read back on start
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+
+    def add(self, paths):
+        if not self.path or not paths:
+            return
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(''.join(f"{path}\n" for path in paths))
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.update(paths)
+
+
+def ingest(paths, client, stream_name, checkpoint=None, concurrency=8, retry_seconds=60, blob_store=None,
+           claim_check_bytes=32 * 1024):
+    """
+    :param paths: iterable of file paths
+    :param client: kinesis client, or a LocalStream
+    :param stream_name: name of the stream
+    :param checkpoint: Checkpoint, files already in it are skipped
+    :param concurrency: maximum number of PutRecords requests in flight
+    :param retry_seconds: how long the records a batch failed to put are retried
+    :return: {"sent", "failed", "oversized", "throttled", "seconds"}
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    counter = ThrottleCounter(client)
+    backpressure = Backpressure(concurrency)
+    stats = {"sent": 0, "failed": 0, "oversized": 0, "throttled": 0}
+    oversized = []
+    lock = threading.Lock()
+    start = time.monotonic()
+
+    def put(batch):
+        counter.throttled = 0
+        try:
+            chunk = [(i, entry) for i, (_, entry) in enumerate(batch)]
+            results = put_with_retry(counter, stream_name, chunk, time.monotonic() + retry_seconds)
+            done = [batch[i][0] for i, result in results.items() if 'ErrorCode' not in result]
+            checkpoint.add(done)
+            with lock:
+                stats['sent'] += len(done)
+                stats['failed'] += len(batch) - len(done)
+                stats['throttled'] += counter.throttled
+            for i, result in results.items():
+                if 'ErrorCode' in result:
+                    print(f"Failed {batch[i][0]}: {result['ErrorCode']} {result.get('ErrorMessage', '')}")
+        finally:
+            backpressure.release(counter.throttled > 0)
+
+    pipeline = batches(
+        encode(to_events(read(skip_done(paths, checkpoint.done)), blob_store, claim_check_bytes)),
+        oversized=oversized
+    )
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        futures = set()
+        for batch in pipeline:
+            # reading stops while the limit of batches is in flight, so memory stays bounded
+            backpressure.acquire()
+            futures.add(executor.submit(put, batch))
+            done = {f for f in futures if f.done()}
+            for f in done:
+                f.result()
+            futures -= done
+        for f in concurrent.futures.as_completed(futures):
+            f.result()
+
+    stats['oversized'] = len(oversized)
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ml_ekg.tools.ingest', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', nargs='?', help='directory to ingest')
+    parser.add_argument('--manifest', help='file listing the files to ingest, one per line')
+    parser.add_argument('--stream', help='Kinesis stream name of the bus')
+    parser.add_argument('--local', help='append the records to this JSON lines file instead of a stream')
+    parser.add_argument('--checkpoint', help='file of the paths already put, to resume an interrupted run')
+    parser.add_argument('--concurrency', type=int, default=8, help='maximum PutRecords requests in flight')
+    parser.add_argument('--retry-seconds', type=float, default=60, help='retry budget of each batch')
+    parser.add_argument('--blob-store',
+                        help='s3://bucket/prefix claim-check store for large images, under the media functions BLOB_STORE')
+    parser.add_argument('--claim-check-bytes', type=int, default=32 * 1024)
+    args = parser.parse_args(argv)
+
+    if bool(args.root) == bool(args.manifest):
+        parser.error('give either a directory or --manifest')
+    if bool(args.stream) == bool(args.local):
+        parser.error('give either --stream or --local')
+
+    if args.local:
+        client = LocalStream(args.local)
+    else:
+        import boto3
+        from botocore.config import Config
+        client = boto3.client("kinesis", config=Config(max_pool_connections=args.concurrency))
+
+    blob_store = None
+    if args.blob_store:
+        from ml_ekg.domains.media.functions.storage.blob import from_uri
+        blob_store = from_uri(args.blob_store)
+
+    paths = read_manifest(args.manifest) if args.manifest else walk(args.root)
+    stats = ingest(paths, client, args.stream or 'local', Checkpoint(args.checkpoint),
+                   concurrency=args.concurrency, retry_seconds=args.retry_seconds, blob_store=blob_store,
+                   claim_check_bytes=args.claim_check_bytes)
+    print(json.dumps(stats))
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
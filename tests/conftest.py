@@ -0,0 +1,42 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the Lambda functions import their siblings and the eventbus layer as top level modules
+for path in (
+        ROOT,
+        os.path.join(ROOT, 'ml_ekg', 'patterns', 'layer'),
+        os.path.join(ROOT, 'ml_ekg', 'patterns', 'functions'),
+        os.path.join(ROOT, 'ml_ekg', 'domains', 'media', 'functions'),
+        os.path.join(ROOT, 'ml_ekg', 'domains', 'ekg', 'functions'),
+):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# module level clients need a region, nothing is called
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('STREAM', 'test-stream')
+os.environ.setdefault('RESOLUTION_STORE', f"file://{tempfile.mkdtemp(prefix='resolution-')}")
+
+
+@pytest.fixture
+def load_function(monkeypatch):
+    """
+    Import a Lambda function of the bus by file name, e.g. put-batch, with environment variables set for the test
+    """
+    def load(name, **env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        path = os.path.join(ROOT, 'ml_ekg', 'patterns', 'functions', f"{name}.py")
+        spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return load
@@ -0,0 +1,78 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import threading
+import time
+
+
+class ClientError(Exception):
+    """
+    Shaped like botocore's ClientError, without the dependency
+    """
+
+    def __init__(self, code, message=''):
+        super().__init__(f"{code}: {message}")
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class FakeKinesis(object):
+    """
+    put_records rejecting the records listed in reject for their first `times` attempts
+    """
+
+    def __init__(self, reject=None, times=1, error=None):
+        """
+        :param reject: {partition key: error code}
+        :param times: attempts a record is rejected for
+        :param error: error code raised by every request, e.g. AccessDeniedException
+        """
+        self.reject = reject or {}
+        self.times = times
+        self.error = error
+        self.attempts = {}
+        self.requests = []
+        self.records = []
+
+    def put_records(self, StreamName, Records):
+        self.requests.append([r['PartitionKey'] for r in Records])
+        if self.error:
+            raise ClientError(self.error)
+        out = []
+        for record in Records:
+            key = record['PartitionKey']
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if key in self.reject and self.attempts[key] <= self.times:
+                out.append({"ErrorCode": self.reject[key], "ErrorMessage": "rejected"})
+                continue
+            self.records.append(record)
+            out.append({"ShardId": "shardId-000000000000", "SequenceNumber": str(len(self.records))})
+        return {"FailedRecordCount": sum('ErrorCode' in r for r in out), "Records": out}
+
+
+class FakeStepFunctions(object):
+    """
+    Executions that take `seconds` and end with the status returned by status(input), counting how many run at
+    the same time
+    """
+
+    def __init__(self, seconds=0.0, status=None):
+        self.seconds = seconds
+        self.status = status or (lambda input_: 'SUCCEEDED')
+        self.inputs = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def start_sync_execution(self, stateMachineArn, name, input):
+        with self.lock:
+            self.inputs.append(input)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.seconds)
+            status = self.status(input)
+            if isinstance(status, Exception):
+                raise status
+            return {"executionArn": name, "status": status}
+        finally:
+            with self.lock:
+                self.running -= 1
@@ -0,0 +1,52 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from eventbus import serde
+from eventbus.aggregate import aggregate, deaggregate, is_aggregated
+
+
+def vertex(i, source='graph.vertex'):
+    return {"source": source, "detail-type": "vertexCreated",
+            "detail": {"metadata": {"~id": f"v{i}"}, "data": {"~id": f"v{i}", "~label": "image"}}}
+
+
+def test_aggregate_round_trip():
+    events = [vertex(i) for i in range(5)]
+    encoded = [(e['source'], serde.dumps(e)) for e in events]
+    groups = aggregate(encoded, ['doc'] * 5)
+
+    assert len(groups) == 1
+    indices, data, key = groups[0]
+    doc = serde.loads(data)
+    assert indices == [0, 1, 2, 3, 4] and key == 'doc'
+    assert is_aggregated(doc) and doc['source'] == 'graph.vertex'
+    assert deaggregate(doc) == events
+
+
+def test_aggregate_keeps_partition_keys():
+    events = [vertex(i) for i in range(12)]
+    keys = [f"doc{'AB'[i % 2]}#{i % 3}" for i in range(12)]
+    groups = aggregate([(e['source'], serde.dumps(e)) for e in events], keys)
+
+    assert sorted(i for indices, _, _ in groups for i in indices) == list(range(12))
+    for indices, _, key in groups:
+        assert {keys[i] for i in indices} == {key}
+
+
+def test_aggregate_passes_other_sources_and_splits_full_records():
+    events = [vertex(i) for i in range(5)] + [vertex(5, source='content.image')]
+    encoded = [(e['source'], serde.dumps(e)) for e in events]
+    groups = aggregate(encoded, ['doc'] * 6, max_records=2)
+
+    assert [indices for indices, _, _ in groups if 5 in indices] == [[5]]
+    assert sorted(len(indices) for indices, _, _ in groups) == [1, 1, 2, 2]
+    assert deaggregate(serde.loads(encoded[5][1])) == [events[5]]
+
+
+def test_aggregate_respects_max_bytes():
+    events = [vertex(i) for i in range(50)]
+    encoded = [(e['source'], serde.dumps(e)) for e in events]
+    groups = aggregate(encoded, ['doc'] * 50, max_bytes=1024)
+
+    assert len(groups) > 1
+    assert all(len(data) <= 1024 for _, data, _ in groups)
+    assert [e for _, data, _ in groups for e in deaggregate(serde.loads(data))] == events
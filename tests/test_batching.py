@@ -0,0 +1,64 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import time
+
+import pytest
+
+from batching import backoff, chunk_records, put_with_retry, record_size
+from fakes import ClientError, FakeKinesis
+
+THROTTLED = 'ProvisionedThroughputExceededException'
+
+
+def entries(n, size=10):
+    return [dict(Data=b"x" * size, PartitionKey=f"k{i}") for i in range(n)]
+
+
+def test_chunks_by_count_and_size():
+    chunks, oversized = chunk_records(entries(5, size=98) + [dict(Data=b"x" * 500, PartitionKey="big")],
+                                      max_records=2, max_bytes=250, max_record_bytes=400)
+
+    assert [[i for i, _ in chunk] for chunk in chunks] == [[0, 1], [2, 3], [4]]
+    assert oversized == [(5, 503)]
+    assert all(sum(record_size(e) for _, e in chunk) <= 250 for chunk in chunks)
+
+
+def test_backoff_is_capped():
+    assert all(0 <= backoff(attempt, base=0.1, cap=0.5) <= 0.5 for attempt in range(20))
+
+
+def test_resends_only_rejected_records():
+    client = FakeKinesis(reject={"k1": THROTTLED, "k3": 'InternalFailure'})
+    chunk = list(enumerate(entries(4)))
+
+    results = put_with_retry(client, 'stream', chunk, time.monotonic() + 5, base=0.001)
+
+    assert client.requests == [["k0", "k1", "k2", "k3"], ["k1", "k3"]]
+    assert all('SequenceNumber' in results[i] for i in range(4))
+
+
+def test_stops_retrying_at_the_deadline():
+    client = FakeKinesis(reject={"k0": THROTTLED}, times=1000)
+
+    results = put_with_retry(client, 'stream', list(enumerate(entries(2))), time.monotonic() + 0.05, base=0.001,
+                             cap=0.01)
+
+    assert results[0]['ErrorCode'] == THROTTLED and 'SequenceNumber' in results[1]
+    assert 1 < len(client.requests) < 1000
+
+
+def test_does_not_retry_other_record_errors():
+    client = FakeKinesis(reject={"k0": 'AccessDeniedException'})
+
+    results = put_with_retry(client, 'stream', list(enumerate(entries(2))), time.monotonic() + 5, base=0.001)
+
+    assert results[0]['ErrorCode'] == 'AccessDeniedException'
+    assert len(client.requests) == 1
+
+
+def test_raises_other_request_errors():
+    client = FakeKinesis(error='AccessDeniedException')
+
+    with pytest.raises(ClientError):
+        put_with_retry(client, 'stream', list(enumerate(entries(2))), time.monotonic() + 5, base=0.001)
+    assert len(client.requests) == 1
@@ -0,0 +1,51 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import os
+
+import pytest
+
+from image import common
+from storage.blob import LocalBlobStore, fetch, within
+
+
+def test_claim_check_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, 'BLOB_STORE', f"file://{tmp_path}")
+    small, large = b"x" * 10, os.urandom(64 * 1024)
+
+    inline = common.store_payload(small, 'small', threshold=1024)
+    stored = common.store_payload(large, 'large', threshold=1024)
+
+    assert 'payload' in inline and common.load_payload(inline) == small
+    assert stored['payloadSize'] == len(large) and common.load_payload(stored) == large
+    assert LocalBlobStore(str(tmp_path)).get('large') == large == fetch(stored['payloadRef'], common.BLOB_STORE)
+
+
+@pytest.mark.parametrize('uri', [
+    's3://payloads/payloads/md5',
+    's3://payloads/payloads/nested/md5',
+])
+def test_references_under_the_store(uri):
+    assert within(uri, 's3://payloads/payloads')
+
+
+@pytest.mark.parametrize('uri', [
+    's3://other/payloads/md5',
+    's3://payloads/secrets/md5',
+    's3://payloads/payloads-other/md5',
+    's3://payloads/payloads/../secrets/md5',
+    'file:///payloads/payloads/md5',
+])
+def test_references_outside_of_the_store(uri):
+    assert not within(uri, 's3://payloads/payloads')
+
+
+def test_load_payload_rejects_foreign_references(tmp_path, monkeypatch):
+    monkeypatch.setattr(common, 'BLOB_STORE', f"file://{tmp_path}")
+    with pytest.raises(ValueError):
+        common.load_payload({"payloadRef": "file:///etc/passwd"})
+    with pytest.raises(ValueError):
+        common.load_payload({"payloadRef": f"file://{tmp_path}/../passwd"})
+
+    monkeypatch.setattr(common, 'BLOB_STORE', None)
+    with pytest.raises(ValueError):
+        common.load_payload({"payloadRef": f"file://{tmp_path}/large"})
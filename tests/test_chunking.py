@@ -0,0 +1,66 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from text.chunking import UNIT, merge_predictions, subwords, windows
+
+
+def token(tag, word, score, start, end):
+    return {"entity": tag, "word": word, "score": score, "start": start, "end": end}
+
+
+def estimate(text):
+    return sum(subwords(unit) for unit in UNIT.findall(text))
+
+
+def test_short_text_is_a_single_window():
+    text = "a short text"
+    assert [(w.start, w.end, w.text) for w in windows(text, max_subwords=10)] == [(0, len(text), text)]
+
+
+def test_windows_overlap_and_cover_the_text():
+    text = ' '.join(f"w{i}" for i in range(100))
+    out = windows(text, max_subwords=20, overlap=4)
+
+    assert out[0].start == 0 and out[-1].end == len(text)
+    for w in out:
+        assert estimate(w.text) <= 20
+        assert w.text == text[w.start:w.end]
+    for a, b in zip(out, out[1:]):
+        # neighbours overlap and split the overlap between them
+        assert b.start < a.end
+        assert a.own_end == b.own_start and b.start <= b.own_start < a.end
+    assert out[0].own_start == 0 and out[-1].own_end == len(text)
+
+
+def test_long_words_count_as_several_subwords():
+    text = ' '.join(["internationalization"] * 40)
+    out = windows(text, max_subwords=50, overlap=5)
+    assert len(out) > 3 and all(estimate(w.text) <= 50 for w in out)
+
+
+def test_text_without_spaces_is_hard_split():
+    text = "東京タワーは東京都港区芝公園にある電波塔である。" * 40
+    out = windows(text, max_subwords=100, overlap=10)
+
+    assert len(out) > 1 and all(len(w.text) <= 100 for w in out)
+    assert out[-1].end == len(text)
+    url = "https://example.com/" + "a" * 2000
+    assert all(estimate(w.text) <= 100 for w in windows(url, max_subwords=100, overlap=10))
+
+
+def test_merge_predictions_keeps_one_copy_of_the_overlap():
+    text = ' '.join(f"w{i}" for i in range(100))
+    out = windows(text, max_subwords=20, overlap=4)
+    # every window tags every one of its tokens, at offsets in the window
+    chunks = []
+    for w in out:
+        predictions = []
+        offset = 0
+        for word in w.text.split(' '):
+            predictions.append(token('B-MISC', word, 0.9, offset, offset + len(word)))
+            offset += len(word) + 1
+        chunks.append((w, predictions))
+
+    merged = merge_predictions(chunks)
+
+    assert [p['word'] for p in merged] == text.split(' ')
+    assert all(text[p['start']:p['end']] == p['word'] for p in merged)
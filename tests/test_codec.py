@@ -0,0 +1,24 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import pytest
+
+from eventbus import codec, serde
+
+
+@pytest.mark.parametrize('name', [c for c in ('zstd', 'gzip') if codec.available(c)])
+def test_codec_round_trip(name):
+    event = {"source": "content.text", "detail-type": "textExtracted",
+             "detail": {"data": {"payload": "lorem ipsum " * 1000}}}
+    data = serde.dumps(event)
+    encoded = codec.encode(data, event['source'], event['detail-type'], codec=name, min_bytes=0)
+    assert len(encoded) < len(data)
+    # the envelope keeps the source readable for the event filters
+    assert serde.loads(encoded)['source'] == 'content.text'
+    assert codec.decode_bytes(encoded) == (event, data)
+
+
+def test_codec_leaves_small_events_unchanged():
+    event = {"source": "graph.vertex", "detail-type": "vertexCreated", "detail": {"data": {"~id": "v0"}}}
+    data = serde.dumps(event)
+    assert codec.encode(data, 'graph.vertex', min_bytes=4096) is data
+    assert codec.decode(data) == event
@@ -0,0 +1,33 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from grapher.common import Node
+from text.cooccurrence import cooccurrences
+from text.ner import cooccurrence_edges
+
+
+def entity(id_, offsets):
+    return {"source": "entity.org", "detail": {"metadata": {"~id": id_}, "data": {"offsets": offsets}}}
+
+
+def test_pairs_within_the_window():
+    mentions = [('a', 0), ('b', 10), ('a', 20), ('c', 1000), ('d', None)]
+    counts = dict(cooccurrences(mentions, window=100))
+
+    assert counts[('a', 'b')] == 2
+    assert ('a', 'c') not in counts and ('b', 'c') not in counts
+    # a mention without offset co-occurs once with every other entity
+    assert counts[('a', 'd')] == counts[('c', 'd')] == 1
+
+
+def test_edges_are_shared_across_documents_and_name_their_contributor():
+    predictions = [entity('a', [[0, 5], [40, 45]]), entity('b', [[10, 15]])]
+    first = cooccurrence_edges(Node(id_='doc1', label='content.text'), predictions)
+    second = cooccurrence_edges(Node(id_='doc2', label='content.text'), predictions, canonical={'b': 'B'})
+
+    [edge] = first
+    assert edge['~from'] == 'a' and edge['~to'] == 'b'
+    assert edge['~accumulate'] == ['weight'] and edge['~contributor'] == 'doc1'
+    assert [float(v) for k, v in edge.items() if k.startswith('weight')] == [2]
+    # canonical entities are linked instead of the mentions
+    assert {second[0]['~from'], second[0]['~to']} == {'a', 'B'} and second[0]['~contributor'] == 'doc2'
+    assert cooccurrence_edges(Node(id_='doc3', label='content.text'), predictions)[0]['~id'] == edge['~id']
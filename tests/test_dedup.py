@@ -0,0 +1,47 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import json
+
+from dedup import Deduplicator, LocalStore
+
+
+def test_shares_seen_content_through_the_store():
+    store = LocalStore()
+    first = Deduplicator('model/1', store=store)
+    second = Deduplicator('model/1', store=store)
+    other_version = Deduplicator('model/1.1', store=store)
+
+    assert not first.seen('md5')
+    first.mark('md5')
+
+    assert first.seen('md5') and second.seen('md5')
+    assert not other_version.seen('md5')
+    assert first.stats['hits_local'] == 1 and second.stats['hits_shared'] == 1
+
+
+def test_entries_expire():
+    dedup = Deduplicator('model/1', ttl=-1)
+    dedup.mark('md5')
+    assert not dedup.seen('md5')
+
+
+def test_lru_is_bounded():
+    dedup = Deduplicator('model/1', size=2)
+    for id_ in ('a', 'b', 'c'):
+        dedup.mark(id_)
+    assert not dedup.seen('a') and dedup.seen('b') and dedup.seen('c')
+
+
+def test_store_errors_do_not_block():
+    class Broken(object):
+        def get(self, key):
+            raise IOError("unreachable")
+
+        def put(self, key, ttl):
+            raise IOError("unreachable")
+
+    dedup = Deduplicator('model/1', store=Broken())
+    dedup.mark('md5')
+    assert not dedup.seen('other')
+    metrics = json.loads(dedup.metrics('ml-ekg/dedup', version='model/1'))
+    assert metrics['errors'] == 2 and metrics['version'] == 'model/1'
@@ -0,0 +1,83 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import numpy as np
+
+from image.detections import LabelConfig, filter_detections, iou, nms
+
+
+def response(detections, labels=('person', 'dog')):
+    """
+    :param detections: [(box, score, class)]
+    """
+    return {
+        "normalized_boxes": [box for box, _, _ in detections],
+        "scores": [score for _, score, _ in detections],
+        "classes": [cls for _, _, cls in detections],
+        "labels": list(labels),
+    }
+
+
+def test_iou():
+    box = np.array([0.0, 0.0, 0.5, 0.5])
+    boxes = np.array([[0.0, 0.0, 0.5, 0.5], [0.25, 0.0, 0.75, 0.5], [0.6, 0.6, 0.9, 0.9]])
+    assert np.allclose(iou(box, boxes), [1.0, 1 / 3, 0.0])
+
+
+def test_nms_keeps_the_best_of_overlapping_boxes():
+    boxes = np.array([[0.0, 0.0, 0.5, 0.5], [0.01, 0.0, 0.51, 0.5], [0.6, 0.6, 0.9, 0.9]])
+    assert list(nms(boxes, np.array([0.7, 0.9, 0.8]), 0.5)) == [1, 2]
+
+
+def test_filter_suppresses_per_label():
+    doc = response([
+        ([0.0, 0.0, 0.5, 0.5], 0.9, 0),
+        ([0.01, 0.0, 0.51, 0.5], 0.8, 0),
+        # same box, another label, is kept
+        ([0.0, 0.0, 0.5, 0.5], 0.85, 1),
+        ([0.6, 0.6, 0.9, 0.9], 0.5, 0),
+    ])
+
+    keep, boxes = filter_detections(doc, LabelConfig(threshold=0.6, merge_iou=0))
+
+    assert list(keep) == [0, 2]
+    assert np.allclose(boxes, [[0.0, 0.0, 0.5, 0.5], [0.0, 0.0, 0.5, 0.5]])
+
+
+def test_filter_merges_overlapping_boxes_by_score():
+    doc = response([
+        ([0.0, 0.0, 0.5, 0.5], 0.9, 0),
+        ([0.02, 0.0, 0.52, 0.5], 0.9, 0),
+    ])
+
+    keep, boxes = filter_detections(doc, LabelConfig(threshold=0.6, nms_iou=0.5, merge_iou=0.7))
+
+    assert list(keep) == [0]
+    assert np.allclose(boxes, [[0.01, 0.0, 0.51, 0.5]])
+
+
+def test_filter_label_overrides_and_top_k():
+    doc = response([
+        ([0.0, 0.0, 0.1, 0.1], 0.9, 0),
+        ([0.2, 0.2, 0.3, 0.3], 0.8, 0),
+        ([0.4, 0.4, 0.5, 0.5], 0.7, 0),
+        ([0.6, 0.6, 0.7, 0.7], 0.65, 1),
+    ])
+    config = LabelConfig(threshold=0.6, top_k=2, labels={"dog": {"threshold": 0.7}})
+
+    keep, _ = filter_detections(doc, config)
+
+    assert list(keep) == [0, 1]
+
+
+def test_filter_without_detections():
+    keep, boxes = filter_detections(response([]), LabelConfig())
+    assert keep.shape == (0,) and boxes.shape == (0, 4)
+
+
+def test_filter_min_area():
+    doc = response([
+        ([0.0, 0.0, 0.05, 0.05], 0.9, 0),
+        ([0.0, 0.0, 0.5, 0.5], 0.8, 0),
+    ])
+    keep, _ = filter_detections(doc, LabelConfig(min_area=0.01))
+    assert list(keep) == [1]
@@ -0,0 +1,33 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import json
+
+import numpy as np
+import pytest
+
+from grapher.embedding import decode, decode_numpy, encode
+
+
+@pytest.mark.parametrize('dtype,tolerance', [('float16', 1e-3), ('float32', 1e-7)])
+def test_round_trip(dtype, tolerance):
+    values = list(np.random.default_rng(0).uniform(-1, 1, 512))
+    encoded = encode(values, dtype)
+
+    assert np.allclose(decode(encoded), values, atol=tolerance)
+    array = decode_numpy(encoded)
+    assert array.dtype == np.dtype(dtype) and np.allclose(array, values, atol=tolerance)
+
+
+def test_float16_is_smaller_than_json():
+    values = list(np.random.default_rng(0).uniform(-1, 1, 512))
+    assert len(encode(values)) < len(json.dumps(values)) / 6
+
+
+def test_decodes_json_lists():
+    assert decode("[0.5, 1.0]") == [0.5, 1.0]
+    assert decode_numpy("[0.5, 1.0]").dtype == np.float32
+
+
+def test_rejects_unknown_versions():
+    with pytest.raises(ValueError):
+        decode("AgEBAAAAADw=")
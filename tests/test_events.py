@@ -0,0 +1,22 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import pytest
+
+pytest.importorskip('neptune_python_utils')
+
+from events import split_accumulated  # noqa: E402
+
+
+def edge(id_, contributor, weight):
+    return {"~id": id_, "~from": "a", "~to": "b", "~label": "entity.org/coOccursWith/entity.org",
+            "weight:Int(single)": weight, "~accumulate": ["weight"], "~contributor": contributor}
+
+
+def test_split_accumulated_keeps_the_last_values_of_each_contributor():
+    plain = {"~id": "e0", "~from": "a", "~to": "b", "~label": "x/rel/y", "score:Double(single)": 0.5}
+    edges, contributions = split_accumulated([plain, edge('e1', 'doc1', 2), edge('e1', 'doc1', 3),
+                                              edge('e1', 'doc2', 1)])
+
+    assert edges[0] == plain
+    assert all(set(e) == {"~id", "~from", "~to", "~label"} for e in edges[1:])
+    assert contributions == {('e1', 'doc1'): ('a', {'weight': 3}), ('e1', 'doc2'): ('a', {'weight': 1})}
@@ -0,0 +1,34 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import json
+
+from inference.cache import InferenceCache, LocalKVStore, LRUCache
+
+
+def test_inference_cache_tiers_and_repeated_payloads():
+    shared = LocalKVStore()
+    calls = []
+
+    def call(missing):
+        calls.append(list(missing))
+        return [f"result-{i}".encode() for i in missing]
+
+    cache = InferenceCache('endpoint', 'v1', [LRUCache(1 << 20), shared])
+    assert cache.get_or_call_many(['a', 'b', 'a'], call) == [b"result-0", b"result-1", b"result-0"]
+    # a repeated payload is inferred once
+    assert calls == [[0, 1]]
+
+    # another container finds the results in the shared tier
+    other = InferenceCache('endpoint', 'v1', [LRUCache(1 << 20), shared])
+    assert other.get_or_call('b', lambda: b"never") == b"result-1"
+    assert json.loads(other.metrics())['hits_LocalKVStore'] == 1
+    # a new model version does not see the results of the previous one
+    assert InferenceCache('endpoint', 'v2', [shared]).get('b') is None
+
+
+def test_lru_cache_is_bounded_by_bytes():
+    lru = LRUCache(10)
+    lru.put('a', b"12345")
+    lru.put('b', b"12345")
+    lru.put('c', b"12345")
+    assert lru.get('a') is None and lru.get('c') == b"12345"
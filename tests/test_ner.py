@@ -0,0 +1,52 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from text.ner import group_predictions, split_tag
+
+
+def token(entity, word, score, start, end):
+    return {"entity": entity, "word": word, "score": score, "start": start, "end": end}
+
+
+def test_split_tag():
+    assert split_tag('B-PER') == ('B', 'PER')
+    assert split_tag('I-ORG') == ('I', 'ORG')
+    assert split_tag('LOC') == ('', 'LOC')
+    assert split_tag('O') == ('O', None)
+
+
+def test_group_subwords_into_spans():
+    text = "Jeff Bezos founded Amazon"
+    spans = group_predictions([
+        token('B-PER', 'Jeff', 0.9, 0, 4),
+        token('I-PER', 'Be', 0.8, 5, 7),
+        token('I-PER', '##zos', 0.7, 7, 10),
+        token('O', 'founded', 0.99, 11, 18),
+        token('B-ORG', 'Amazon', 0.95, 19, 25),
+    ], text=text)
+
+    assert [(s['entity'], s['word'], s['start'], s['end']) for s in spans] == [
+        ('PER', 'Jeff Bezos', 0, 10),
+        ('ORG', 'Amazon', 19, 25),
+    ]
+    assert abs(spans[0]['score'] - 0.8) < 1e-9
+
+
+def test_group_inside_tag_without_begin():
+    # an I- tag opening a span used to crash the assembler
+    spans = group_predictions([
+        token('I-ORG', 'Amazon', 0.9, 0, 6),
+        token('I-ORG', 'Web', 0.8, 7, 10),
+        token('I-LOC', 'Seattle', 0.7, 14, 21),
+    ])
+
+    assert [(s['entity'], s['word']) for s in spans] == [('ORG', 'Amazon Web'), ('LOC', 'Seattle')]
+
+
+def test_group_splits_on_gaps_and_begin_tags():
+    spans = group_predictions([
+        token('I-PER', 'Ada', 0.9, 0, 3),
+        token('I-PER', 'Alan', 0.9, 20, 24),
+        token('B-PER', 'Grace', 0.9, 25, 30),
+    ], aggregate='min')
+
+    assert [s['word'] for s in spans] == ['Ada', 'Alan', 'Grace']
@@ -0,0 +1,55 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import pytest
+
+from partition import partition_keys
+
+
+def vertex(id_, source='graph.vertex'):
+    return {"source": source, "detail": {"metadata": {"~id": id_}, "data": {"~id": id_}}}
+
+
+def edge(src, dst):
+    return {"source": "graph.edge", "detail": {"metadata": {"~id": f"{src}-{dst}"},
+                                               "data": {"~id": f"{src}-{dst}", "~from": src, "~to": dst}}}
+
+
+def test_lineage_keys_follow_edges_to_the_root():
+    records = [vertex('doc'), vertex('crop'), edge('crop', 'doc'), vertex('label'), edge('label', 'crop'),
+               vertex('other')]
+
+    assert partition_keys(records) == ['doc', 'doc', 'doc', 'doc', 'doc', 'other']
+
+
+def test_other_strategies():
+    records = [vertex('a', source='graph.vertex'), vertex('b', source='graph.edge')]
+
+    assert partition_keys(records, strategy='id') == ['a', 'b']
+    assert partition_keys(records, strategy='source') == ['graph.vertex', 'graph.edge']
+    random = partition_keys(records, strategy='random')
+    assert len(set(random)) == 2
+
+
+def test_records_without_a_key_get_a_random_one():
+    keys = partition_keys([{"source": "x"}, {"source": "x"}], strategy='id')
+    assert len(set(keys)) == 2 and all(keys)
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        partition_keys([], strategy='shard')
+
+
+def test_hot_keys_are_salted_deterministically():
+    records = [vertex('doc')] + [vertex(f"e{i}") for i in range(40)] + [edge(f"e{i}", 'doc') for i in range(40)]
+    records.append(vertex('cold'))
+
+    keys = partition_keys(records, salt_buckets=4, hot_key_threshold=10)
+
+    hot = keys[:-1]
+    assert {key.split('#')[0] for key in hot} == {'doc'}
+    assert 1 < len(set(hot)) <= 4
+    # below the threshold a key is left alone
+    assert keys[-1] == 'cold'
+    # the same record always gets the same salt
+    assert partition_keys(records, salt_buckets=4, hot_key_threshold=10) == keys
@@ -0,0 +1,101 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import io
+
+import numpy as np
+from PIL import Image
+
+from image.phash import PHashIndex, find_duplicate, fingerprint, hamming
+from storage.blob import LocalBlobStore
+
+
+def image(seed, size=(640, 480)):
+    pixels = np.random.default_rng(seed).random((12, 16)) * 255
+    return Image.fromarray(pixels.astype('uint8')).resize(size, Image.BICUBIC).convert('RGB')
+
+
+def jpeg(im, quality=90):
+    out = io.BytesIO()
+    im.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+def test_fingerprint_of_a_resized_copy():
+    hash_, phash, aspect = fingerprint(jpeg(image(0)))
+    copy_hash, copy_phash, copy_aspect = fingerprint(jpeg(image(0).resize((320, 240)), quality=60))
+    other_hash, other_phash, _ = fingerprint(jpeg(image(1)))
+
+    assert hamming(hash_, copy_hash) <= 2 and hamming(phash, copy_phash) <= 6
+    assert hamming(hash_, other_hash) > 8 and hamming(phash, other_phash) > 8
+    assert aspect == copy_aspect == 640 / 480
+
+
+def test_near_duplicates_are_found():
+    index = PHashIndex()
+    assert find_duplicate(index, jpeg(image(0)), 'a', 'content.image.jpeg') is None
+    assert find_duplicate(index, jpeg(image(1)), 'b', 'content.image.jpeg') is None
+
+    copy = jpeg(image(0).resize((320, 240)), quality=60)
+    assert find_duplicate(index, copy, 'c', 'content.image.jpeg') == ('a', 'content.image.jpeg')
+    # an image is not a near-duplicate of itself
+    assert find_duplicate(index, jpeg(image(1)), 'b', 'content.image.jpeg') is None
+
+
+def test_flat_images_are_not_matched():
+    index = PHashIndex()
+    for i, color in enumerate([(255, 255, 255), (250, 250, 250), (0, 0, 0)]):
+        blank = jpeg(Image.new('RGB', (640, 480), color))
+        assert find_duplicate(index, blank, f"blank{i}", 'content.image.jpeg') is None
+    assert not index.entries
+
+
+def test_matches_are_confirmed_by_dct_hash_and_aspect_ratio():
+    index = PHashIndex(max_distance=2)
+    hash_, phash, aspect = fingerprint(jpeg(image(0)))
+    index.add(hash_, 'a', 'content.image.jpeg', phash, aspect)
+
+    assert index.lookup(hash_ ^ 0b11, 'b', phash, aspect) == ('a', 'content.image.jpeg')
+    assert index.lookup(hash_ ^ 0b111, 'b', phash, aspect) is None
+    assert index.lookup(hash_, 'b', phash ^ 0xff, aspect) is None
+    assert index.lookup(hash_, 'b', phash, aspect * 1.5) is None
+
+
+def test_multi_index_lookup_finds_every_hash_within_max_distance():
+    rng = np.random.default_rng(0)
+    index = PHashIndex(max_distance=4)
+    assert len(index.parts) == 5
+    hashes = [int(h) for h in rng.integers(0, 1 << 63, 500)]
+    for i, hash_ in enumerate(hashes):
+        index.add(hash_, f"v{i}", 'content.image.jpeg', 0, 1.0)
+
+    for i, hash_ in enumerate(hashes[:50]):
+        # flip max_distance bits spread over the parts
+        flipped = hash_ ^ (1 << 3) ^ (1 << 20) ^ (1 << 40) ^ (1 << 60)
+        assert index.lookup(flipped, None, 0, 1.0) == (f"v{i}", 'content.image.jpeg')
+
+
+def test_eviction_drops_the_oldest_entries():
+    hashes = [int(h) for h in np.random.default_rng(1).integers(0, 1 << 63, 11)]
+    index = PHashIndex(max_entries=10)
+    for i, hash_ in enumerate(hashes):
+        index.insert(hash_, f"v{i}", 'content.image.jpeg', float(i), 0, 1.0)
+    index.evict()
+
+    assert len(index.entries) == 9 and hashes[0] not in index.entries
+    assert index.lookup(hashes[0]) is None and index.lookup(hashes[10]) == ('v10', 'content.image.jpeg')
+
+
+def test_saved_index_is_shared(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    first = PHashIndex(store, key='phash/od')
+    find_duplicate(first, jpeg(image(0)), 'a', 'content.image.jpeg')
+    first.save(force=True)
+
+    # entries saved without a DCT hash are skipped
+    store.put('phash/od/ff.json', b'{"entries": [["ffffffffffff0000", "old", "content.image.jpeg", 0]]}')
+
+    second = PHashIndex(store, key='phash/od', shards=256)
+    second.load()
+    assert [entry[0] for entry in second.entries.values()] == ['a']
+    copy = jpeg(image(0).resize((320, 240)), quality=60)
+    assert find_duplicate(second, copy, 'b', 'content.image.jpeg') == ('a', 'content.image.jpeg')
@@ -0,0 +1,86 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import pytest
+
+from eventbus import serde
+from eventbus.aggregate import deaggregate
+from fakes import FakeKinesis
+
+
+def vertices(n):
+    return [{"source": "content.image", "detail": {"metadata": {"~id": f"v{i}"}, "data": {"~id": f"v{i}"}}}
+            for i in range(n)]
+
+
+@pytest.fixture
+def put_batch(load_function):
+    module = load_function('put-batch', PARTITION_KEY='id', AGGREGATE_SOURCES='', CODEC='none',
+                           RETRY_BUDGET_SECONDS='0.2')
+    module.kinesis = FakeKinesis()
+    return module
+
+
+def test_puts_every_record(put_batch):
+    out = put_batch.handler({"records": vertices(3)}, None)
+
+    assert out['sent'] == 3 and not out['partial']
+    assert [s['status'] for s in out['results']] == ['ok'] * 3
+    assert len(put_batch.kinesis.records) == 3
+
+
+def test_retried_records_succeed(put_batch):
+    put_batch.kinesis.reject = {"v1": 'ProvisionedThroughputExceededException'}
+
+    out = put_batch.handler({"records": vertices(3)}, None)
+
+    assert out['sent'] == 3
+    assert put_batch.kinesis.requests == [["v0", "v1", "v2"], ["v1"]]
+
+
+def test_fails_when_records_are_still_rejected(put_batch):
+    put_batch.kinesis.reject = {"v1": 'ProvisionedThroughputExceededException'}
+    put_batch.kinesis.times = 1000
+
+    with pytest.raises(put_batch.RecordsNotPut, match='"failed": 1'):
+        put_batch.handler({"records": vertices(3)}, None)
+
+
+def lineage(doc, n):
+    # a document vertex, and n entities linked to it
+    events = [{"source": "graph.vertex", "detail": {"metadata": {"~id": doc}, "data": {"~id": doc}}}]
+    for i in range(n):
+        id_ = f"{doc}-e{i}"
+        events.append({"source": "graph.vertex", "detail": {"metadata": {"~id": id_}, "data": {"~id": id_}}})
+        events.append({"source": "graph.edge", "detail": {"metadata": {"~id": f"{id_}-edge"},
+                                                          "data": {"~from": id_, "~to": doc}}})
+    return events
+
+
+def test_aggregated_records_keep_lineage_keys(load_function):
+    put_batch = load_function('put-batch', PARTITION_KEY='lineage', PARTITION_SALT_BUCKETS=4,
+                              PARTITION_HOT_KEY_THRESHOLD=10, AGGREGATE_SOURCES='graph.', CODEC='none')
+    put_batch.kinesis = FakeKinesis()
+    records = [r for pair in zip(lineage('docA', 50), lineage('docB', 50)) for r in pair]
+
+    out = put_batch.handler({"records": records}, None)
+
+    assert out['sent'] == len(records) and out['entries'] < len(records)
+    for record in put_batch.kinesis.records:
+        events = deaggregate(serde.loads(record['Data']))
+        # every event of a record belongs to the lineage of its partition key
+        doc, _ = record['PartitionKey'].split('#')
+        assert all(e['detail']['metadata']['~id'].startswith(doc) for e in events)
+
+
+def test_oversized_aggregate_reports_every_event(load_function):
+    put_batch = load_function('put-batch', PARTITION_KEY='source', AGGREGATE_SOURCES='graph.',
+                              AGGREGATE_MAX_BYTES=1 << 20, MAX_RECORD_BYTES=2000, CODEC='none')
+    put_batch.kinesis = FakeKinesis()
+    records = [{"source": "graph.vertex", "detail": {"metadata": {"~id": f"v{i}"}, "data": {"p": "x" * 500}}}
+               for i in range(10)]
+
+    out = put_batch.handler({"records": records}, None)
+
+    assert out['oversized'] == 10 and out['sent'] == 0
+    assert [s['status'] for s in out['results']] == ['oversized'] * 10
+    assert [s['index'] for s in out['results']] == list(range(10))
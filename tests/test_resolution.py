@@ -0,0 +1,58 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+from storage.blob import LocalBlobStore
+from text.ner import aggregate_entities
+from text.resolution import ResolutionIndex, normalize
+
+
+def test_normalize():
+    assert normalize("The Amazon.com, Inc.") == "amazon com"
+    assert normalize("ＡＣＭＥ Corp") == "acme"
+    assert normalize("Inc") == "inc"
+
+
+def test_resolves_variants_to_the_first_mention():
+    index = ResolutionIndex()
+    assert index.resolve('org', "Amazon Web Services", 'e1') == 'e1'
+    assert index.resolve('org', "Amazon Web Services, Inc.", 'e2') == 'e1'
+    # close enough on character n-grams
+    assert index.resolve('org', "Amazon Web Service", 'e3') == 'e1'
+    assert index.resolve('org', "Acme", 'e4') == 'e4'
+    # labels do not mix
+    assert index.resolve('loc', "Amazon Web Services", 'e5') == 'e5'
+
+
+def test_oldest_entities_are_evicted():
+    index = ResolutionIndex(max_entries=10)
+    for i in range(11):
+        index.resolve('per', f"person number {i:04d} xyz{i}", f"e{i}")
+
+    assert len(index.entries) == 9
+    assert ('per', 'person number 0000 xyz0') not in index.entries
+    assert all(key in index.grams for key in index.entries)
+    assert {key for keys in index.buckets.values() for key in keys} == set(index.entries)
+
+
+def test_saves_merge_across_containers(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    first = ResolutionIndex(store, key='resolution/ner.json')
+    second = ResolutionIndex(store, key='resolution/ner.json')
+    first.resolve('org', "Amazon", 'e1')
+    second.resolve('org', "Acme", 'e2')
+    first.save(force=True)
+    second.save(force=True)
+
+    third = ResolutionIndex(store, key='resolution/ner.json')
+    assert third.resolve('org', "Amazon Inc.", 'e3') == 'e1'
+    assert third.resolve('org', "ACME", 'e4') == 'e2'
+
+
+def test_aggregate_mentions_per_entity():
+    entities = aggregate_entities([
+        {"entity": "ORG", "word": "Amazon", "score": 0.9, "start": 0, "end": 6},
+        {"entity": "ORG", "word": "Amazon, Inc.", "score": 0.95, "start": 30, "end": 42},
+        {"entity": "ORG", "word": "Acme", "score": 0.4, "start": 50, "end": 54},
+    ])
+
+    assert entities == [{"entity": "org", "word": "Amazon", "score": 0.95, "mentions": 2,
+                         "offsets": [[0, 6], [30, 42]]}]
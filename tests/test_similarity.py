@@ -0,0 +1,68 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import numpy as np
+
+from image.similarity import IndexStore, SimilarityIndex
+from storage.blob import LocalBlobStore
+
+
+def vectors(n, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def test_exact_search():
+    x = vectors(100)
+    index = SimilarityIndex(ivf_min=1000)
+    for i, v in enumerate(x):
+        index.add(f"v{i}", 'image', v)
+
+    results = index.search(x[7] + 0.01, k=3, min_score=-1)
+    assert results[0][1] == 'v7' and len(results) == 3
+    assert [id_ for _, id_, _ in index.search(x[7], k=3, min_score=-1, exclude='v7')][0] != 'v7'
+    assert index.search(-x[7], k=3, min_score=0.99) == []
+
+
+def test_ivf_search_finds_the_nearest_vectors():
+    x = vectors(2000)
+    index = SimilarityIndex(ivf_min=500, nlist=16, nprobe=4)
+    for i, v in enumerate(x):
+        index.add(f"v{i}", 'image', v)
+    assert index.lists is not None and index.trained_size >= 1000
+
+    found = sum(index.search(x[i] + 0.01, k=1, min_score=0)[0][1] == f"v{i}" for i in range(0, 2000, 20))
+    assert found >= 95
+
+
+def test_oldest_vectors_are_dropped():
+    x = vectors(120)
+    index = SimilarityIndex(max_entries=100)
+    for i, v in enumerate(x):
+        index.add(f"v{i}", 'image', v)
+    assert len(index) <= 100 and 'v0' not in index and 'v119' in index
+
+    index.limit(50 * 4 * 32)
+    assert len(index) <= 49 and 'v119' in index
+    assert index.nbytes <= 50 * 4 * 32
+
+
+def test_indexes_are_merged_through_the_store(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    x = vectors(20)
+    first, second = IndexStore(store), IndexStore(store)
+    for i in range(10):
+        first.add('image', f"v{i}", 'image', x[i])
+    first.save(force=True)
+    for i in range(10, 20):
+        second.add('image', f"v{i}", 'image', x[i])
+    second.save(force=True)
+
+    assert len(IndexStore(store).get('image')) == 20
+    assert second.add('image', 'copy', 'image', x[3])[0][1] == 'v3'
+
+
+def test_indexes_share_max_bytes():
+    x = vectors(200)
+    indexes = IndexStore(max_bytes=150 * 4 * 32)
+    for i, v in enumerate(x):
+        indexes.add('a' if i % 4 else 'b', f"v{i}", 'image', v)
+    assert sum(index.nbytes for index in indexes.indexes.values()) <= 150 * 4 * 32
@@ -0,0 +1,99 @@
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+import base64
+
+import pytest
+
+from eventbus import serde
+from fakes import ClientError, FakeStepFunctions
+
+
+def content(i):
+    return {"source": "content.image", "detail-type": "imageCreated",
+            "detail": {"metadata": {"~id": f"img{i}"}, "data": {"payload": "..."}}}
+
+
+def kinesis_event(events):
+    return {"Records": [
+        {"kinesis": {"partitionKey": f"k{i}", "sequenceNumber": f"{i:056d}",
+                     "data": base64.b64encode(serde.dumps(e)).decode("utf-8")}}
+        for i, e in enumerate(events)
+    ]}
+
+
+@pytest.fixture
+def stream(load_function):
+    def load(**env):
+        module = load_function('stream', STEPFUNCTION='arn:aws:states:us-east-1:0:stateMachine:test', **env)
+        module.sfn = FakeStepFunctions()
+        return module
+    return load
+
+
+def failures(out):
+    return [int(f['itemIdentifier']) for f in out['batchItemFailures']]
+
+
+def test_executions_start_concurrently(stream):
+    module = stream(CONCURRENCY=4)
+    module.sfn.seconds = 0.05
+
+    out = module.handler(kinesis_event([content(i) for i in range(8)]), None)
+
+    assert out == {"batchItemFailures": []}
+    assert len(module.sfn.inputs) == 8
+    assert 1 < module.sfn.max_running <= 4
+
+
+def test_failed_starts_and_executions_are_reported(stream):
+    module = stream()
+    outcomes = {"img1": ClientError('ExecutionLimitExceeded'), "img2": 'FAILED', "img4": 'TIMED_OUT'}
+    module.sfn.status = lambda input_: outcomes.get(serde.loads(input_)['detail']['metadata']['~id'], 'SUCCEEDED')
+
+    out = module.handler(kinesis_event([content(i) for i in range(5)]), None)
+
+    assert failures(out) == [1, 2, 4]
+
+
+def test_micro_batches_by_count_and_size(stream):
+    module = stream()
+    executions = [({f"s{i}"}, f"n{i}", '{"i": %d}' % i, {f"c{i}"}) for i in range(5)]
+
+    batches = module.micro_batches(executions, max_records=2, max_bytes=1024)
+
+    assert [(sorted(seqs), name) for seqs, name, _, _ in batches] == [
+        (['s0', 's1'], 'n0'), (['s2', 's3'], 'n2'), (['s4'], 'n4')]
+    assert serde.loads(batches[0][2]) == {"records": [{"i": 0}, {"i": 1}]}
+    assert len(module.micro_batches(executions, max_records=10, max_bytes=12)) == 5
+
+
+def test_micro_batch_executions(stream):
+    module = stream(MICRO_BATCH=3)
+    module.sfn.status = lambda input_: 'FAILED' if '"img4"' in input_ else 'SUCCEEDED'
+
+    out = module.handler(kinesis_event([content(i) for i in range(7)]), None)
+
+    inputs = [serde.loads(input_) for input_ in module.sfn.inputs]
+    assert sorted(len(input_['records']) for input_ in inputs) == [1, 3, 3]
+    assert sorted(r['detail']['metadata']['~id'] for input_ in inputs for r in input_['records']) == \
+        [f"img{i}" for i in range(7)]
+    # a failed micro-batch reports every one of its records
+    assert failures(out) == [3, 4, 5]
+
+
+def test_recently_processed_content_is_skipped(stream):
+    module = stream(DEDUP_VERSION='model/1')
+    events = [content(0), content(1), content(0)]
+
+    module.handler(kinesis_event(events), None)
+    # content seen in the batch is started once
+    assert len(module.sfn.inputs) == 2
+
+    module.sfn.status = lambda input_: 'FAILED' if '"img2"' in input_ else 'SUCCEEDED'
+    out = module.handler(kinesis_event([content(1), content(2)]), None)
+    assert len(module.sfn.inputs) == 3 and failures(out) == [1]
+
+    # the failed execution was not marked, its retry runs again
+    module.sfn.status = lambda input_: 'SUCCEEDED'
+    module.handler(kinesis_event([content(2)]), None)
+    assert len(module.sfn.inputs) == 4